@@ -0,0 +1,266 @@
+"""benchmark.py: Synthetic vault generation and timing of the bulk operations"""
+
+import io
+import sys
+import time
+import random
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import importlib
+import contextlib
+
+common = importlib.import_module("common")
+properties = importlib.import_module("properties")
+sap = importlib.import_module("search-and-replace")
+dnu = importlib.import_module("daily-note-utils")
+upc = importlib.import_module("update-people-contacted")
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam"
+).split()
+# dailies count back from a fixed day so every generated vault is identical.
+LAST_DAILY = datetime.date(2024, 12, 31)
+
+
+def generate_vault(
+    root_path,
+    notes=1000,
+    frontmatter_size=5,
+    body_size=40,
+    link_density=0.1,
+    meeting_ratio=0.2,
+    people_ratio=0.1,
+    daily_years=1,
+    seed=0,
+):
+    # notes are split into people, meetings and plain notes by the ratios,
+    # body_size is in lines, link_density is the chance a line has a wikilink
+    # and daily_years adds that many years of YYYY-MM-DD.md daily notes.
+    root_path = common.get_path(root_path)
+    generator = random.Random(seed)
+    people_count = max(1, int(notes * people_ratio))
+    meeting_count = int(notes * meeting_ratio)
+    plain_count = max(0, notes - people_count - meeting_count)
+    people = [f"Person {index}" for index in range(people_count)]
+    titles = people + [f"Note {index}" for index in range(plain_count)]
+
+    def write_note(note_path, frontmatter, body_lines):
+        note_path.parent.mkdir(parents=True, exist_ok=True)
+        property_lines = properties.build_properties_lines(frontmatter)
+        common.write_file_lines(note_path, property_lines + body_lines)
+
+    def build_frontmatter(extra):
+        frontmatter = dict(extra)
+        for index in range(frontmatter_size - len(extra)):
+            frontmatter[f"key{index}"] = generator.choice(WORDS)
+        return frontmatter
+
+    def build_body():
+        body_lines = []
+        for _ in range(body_size):
+            line = " ".join(generator.choices(WORDS, k=generator.randint(4, 12)))
+            if generator.random() < link_density:
+                line += f" [[{generator.choice(titles)}]]"
+            body_lines.append(line + "\n")
+        if body_lines and generator.random() < 0.2:
+            body_lines[-1:-1] = ["\n", "```dataview\n", "list\n", "```\n"]
+        return body_lines
+
+    people_path = root_path / "Community" / "People"
+    for index, person in enumerate(people):
+        extra = {"aliases": [f"P{index}"], "contacted": "2020-01-01"}
+        write_note(people_path / f"{person}.md", build_frontmatter(extra), build_body())
+    meetings_path = root_path / "Community" / "Meetings"
+    for index in range(meeting_count):
+        transpired = LAST_DAILY - datetime.timedelta(days=generator.randrange(730))
+        attendees = generator.sample(people, k=min(len(people), 3))
+        extra = {
+            "transpired": transpired.isoformat(),
+            "attendees": [f'"[[{attendee}]]"' for attendee in attendees],
+        }
+        meeting_path = meetings_path / f"Meeting {index}.md"
+        write_note(meeting_path, build_frontmatter(extra), build_body())
+    for index in range(plain_count):
+        note_path = root_path / "Notes" / f"Note {index}.md"
+        write_note(note_path, build_frontmatter({}), build_body())
+    for offset in range(int(daily_years * 365)):
+        day = LAST_DAILY - datetime.timedelta(days=offset)
+        yesterday = (day - datetime.timedelta(days=1)).isoformat()
+        tomorrow = (day + datetime.timedelta(days=1)).isoformat()
+        frontmatter = build_frontmatter({"created": day.isoformat()})
+        # pad so the header lands on the line daily-note-utils rewrites
+        used_lines = len(properties.build_properties_lines(frontmatter)) + 1
+        body_lines = [
+            f"[[{yesterday}|yesterday]] [[{tomorrow}|tomorrow]]\n",
+            *["\n"] * max(0, dnu.HEADER_INDEX - used_lines),
+            day.strftime("# %A, %B %d, %Y\n"),
+            *build_body(),
+        ]
+        daily_path = root_path / "Dailys" / str(day.year) / day.strftime("%B")
+        write_note(daily_path / f"{day}.md", frontmatter, body_lines)
+    (root_path / "Extras" / "Other").mkdir(parents=True, exist_ok=True)
+    return root_path
+
+
+def use_vault(root_path):
+    # point update-people-contacted at the synthetic vault.
+    base_path = str(root_path) + "/"
+    upc.BASE_PATH = base_path
+    upc.MEETINGS_DIRECTORY = base_path + "Community/Meetings/"
+    upc.PEOPLE_DIRECTORY = base_path + "Community/People/"
+    upc.UPDATED_JSON = base_path + "Extras/Other/meetings.json"
+    upc.CONTACTED_JSON = base_path + "Extras/Other/contacted.json"
+    upc.PEOPLE_INDEX.update(signature=None, names={})
+
+
+def read_all_properties(root_path):
+    for file_path in common.gather_files(root_path):
+        properties.get_property_json(file_path)
+
+
+def remove_manifest(root_path):
+    common.get_manifest_path(root_path).unlink(missing_ok=True)
+
+
+def get_operations():
+    # (name, function of the vault path, whether it modifies the vault, and
+    # an untimed setup run on the vault before each repeat or None)
+    return [
+        ("gather_files", lambda root: common.gather_files(root), False, None),
+        (
+            "gather_files_manifest_cold",
+            lambda root: common.gather_files(root, manifest=True),
+            False,
+            remove_manifest,
+        ),
+        (
+            "gather_files_manifest_warm",
+            lambda root: common.gather_files(root, manifest=True),
+            False,
+            common.refresh_manifest,
+        ),
+        ("get_property_json", read_all_properties, False, None),
+        (
+            "is_in_files",
+            lambda root: sap.is_in_files(root, sap.ISO_DATE_REGEX),
+            False,
+            None,
+        ),
+        (
+            "replace_in_files",
+            lambda root: sap.replace_in_files(root, r"\blorem\b", "LOREM"),
+            True,
+            None,
+        ),
+        (
+            "updateDailyDates",
+            lambda root: dnu.updateDailyDates(str(root / "Dailys"), recursively=True),
+            True,
+            None,
+        ),
+        (
+            "update_contacted_overall",
+            lambda root: upc.update_contacted_overall(),
+            True,
+            None,
+        ),
+        (
+            "update_contacted_aggregated",
+            lambda root: upc.update_contacted_overall(aggregate=True),
+            True,
+            None,
+        ),
+    ]
+
+
+def time_operation(vault_path, operation, modifies, setup, repeat, scratch_path):
+    # operations that modify the vault run on a fresh copy each time, and the
+    # copying (like the setup) is left out of the timing.
+    timings = []
+    for _ in range(repeat):
+        root_path = vault_path
+        if modifies:
+            shutil.rmtree(scratch_path, ignore_errors=True)
+            root_path = common.get_path(shutil.copytree(vault_path, scratch_path))
+        use_vault(root_path)
+        if setup is not None:
+            setup(root_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            operation(root_path)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_benchmarks(sizes, repeat=3, **generator_options):
+    results = []
+    with tempfile.TemporaryDirectory() as temporary:
+        temporary = common.get_path(temporary)
+        for size in sizes:
+            vault_path = generate_vault(
+                temporary / f"vault-{size}", notes=size, **generator_options
+            )
+            for name, operation, modifies, setup in get_operations():
+                timings = time_operation(
+                    vault_path,
+                    operation,
+                    modifies,
+                    setup,
+                    repeat,
+                    temporary / "scratch",
+                )
+                results.append(
+                    {
+                        "operation": name,
+                        "notes": size,
+                        "seconds": timings,
+                        "best": min(timings),
+                        "mean": sum(timings) / len(timings),
+                    }
+                )
+                print(f"{name:<28} {size:>7} notes  best {min(timings):.4f}s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bulk operations.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--frontmatter-size", type=int, default=5)
+    parser.add_argument("--body-size", type=int, default=40)
+    parser.add_argument("--link-density", type=float, default=0.1)
+    parser.add_argument("--meeting-ratio", type=float, default=0.2)
+    parser.add_argument("--people-ratio", type=float, default=0.1)
+    parser.add_argument("--daily-years", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json")
+    arguments = parser.parse_args()
+
+    generator_options = {
+        "frontmatter_size": arguments.frontmatter_size,
+        "body_size": arguments.body_size,
+        "link_density": arguments.link_density,
+        "meeting_ratio": arguments.meeting_ratio,
+        "people_ratio": arguments.people_ratio,
+        "daily_years": arguments.daily_years,
+        "seed": arguments.seed,
+    }
+    results = run_benchmarks(arguments.sizes, arguments.repeat, **generator_options)
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "sizes": arguments.sizes,
+        "repeat": arguments.repeat,
+        "parameters": generator_options,
+        "results": results,
+    }
+    common.write_updated_json(arguments.output, report)
+
+
+if __name__ == "__main__":
+    main()
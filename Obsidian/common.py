@@ -1,7 +1,13 @@
 """common.py: Commonly used functions across Obsidian scripting"""
 
+import os
 import pathlib
 import json
+import functools
+import collections
+import concurrent.futures
+
+MANIFEST_NAME = ".vault-manifest.json"
 
 
 def get_path(file_path):
@@ -24,22 +30,51 @@ def read_file_lines(file_path):
         return lines
 
 
-def write_file_lines(file_path, write_lines):
+def read_frontmatter_lines(file_path, delimeter="---"):
+    # stream the note only as far as the properties section's closing
+    # delimeter, returning those lines and the character offset of the body.
+    # notes without a (closed) properties section give ([], 0).
+    file_path = get_path(file_path)
+    frontmatter_lines, offset, opened = [], 0, False
+    with open(file_path, "r") as fp:
+        for line in fp:
+            frontmatter_lines.append(line)
+            offset += len(line)
+            if line.rstrip() == delimeter:
+                if opened:
+                    return frontmatter_lines, offset
+                opened = True
+            elif not opened and line.strip():
+                break  # the properties section has to open the note
+    return [], 0
+
+
+def write_file_lines(file_path, write_lines, original=None):
+    # given the lines originally read, skip the write (and the mtime bump that
+    # makes Obsidian Sync re-upload the note) when nothing changed.
+    if original is not None and list(write_lines) == list(original):
+        return False
     file_path = get_path(file_path)
     with open(file_path, "w") as fp:
         fp.writelines(write_lines)
         return True
 
 
-def write_file_contents(file_path, contents):
+def write_file_contents(file_path, contents, original=None):
+    if original is not None and contents == original:
+        return False
     file_path = get_path(file_path)
     with open(file_path, "w") as fp:
         fp.write(contents)
         return True
 
 
-def gather_files(root_path):
+def gather_files(root_path, manifest=False):
     root_path = get_path(root_path)
+    if manifest:
+        # only names are needed, so the notes themselves aren't re-stat'ed.
+        vault_manifest = refresh_manifest(root_path, stat_files=False)
+        return [root_path / relative for relative in sorted(vault_manifest["files"])]
     file_list = []
     for fp in root_path.rglob("*.md"):
         if fp.is_file():
@@ -47,6 +82,211 @@ def gather_files(root_path):
     return file_list
 
 
+def run_file_function(file_function, args, kwargs, file_path):
+    # errors are returned rather than raised so one bad note can't sink a batch.
+    try:
+        return file_function(file_path, *args, **kwargs)
+    except Exception as failure:
+        return failure
+
+
+def run_on_files(file_list, file_function, *args, workers=None, threads=None, **kwargs):
+    # apply file_function to each file, returning (file_path, result) tuples in
+    # file_list order. with workers, files are spread across a process pool, so
+    # file_function and its arguments must be picklable (module-level). with
+    # threads, files are handled by a thread pool instead, which overlaps the
+    # open/read/write latency of slow filesystems (like WSL's /mnt/c) rather
+    # than spreading CPU work. in every mode a failing file gives its error as
+    # the result, so one bad file can't sink the batch.
+    if workers and threads:
+        raise ValueError("Supply either workers or threads, not both!")
+    handler = functools.partial(run_file_function, file_function, args, kwargs)
+    if threads:
+        return list(zip(file_list, map_ahead(handler, file_list, threads)))
+    if not workers:
+        return [(fp, handler(fp)) for fp in file_list]
+    chunksize = max(1, len(file_list) // (workers * 4))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(handler, file_list, chunksize=chunksize)
+        return list(zip(file_list, results))
+
+
+def map_ahead(handler, items, threads, read_ahead=None):
+    # yield handler(item) in order using a thread pool, keeping at most
+    # read_ahead items in flight so memory stays bounded on large vaults.
+    read_ahead = read_ahead or threads * 2
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(handler, item))
+            if len(pending) >= read_ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_files_ahead(file_list, threads=8, read_ahead=None):
+    # yield (file_path, contents) in order while later files are already being
+    # read, so processing overlaps the I/O. unreadable files give the error.
+    handler = functools.partial(run_file_function, read_file_contents, (), {})
+    contents = map_ahead(handler, file_list, threads, read_ahead=read_ahead)
+    return zip(file_list, contents)
+
+
+def get_manifest_path(root_path):
+    return get_path(root_path) / MANIFEST_NAME
+
+
+def scan_manifest_directory(root_path, relative, vault_manifest):
+    # stat a single directory, recording its markdown files and returning the
+    # relative paths of any subdirectories found within it.
+    directory = root_path / relative if relative else root_path
+    try:
+        directory_mtime = directory.stat().st_mtime_ns
+        entries = list(os.scandir(directory))
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    vault_manifest["directories"][relative] = directory_mtime
+    subdirectories = []
+    for entry in entries:
+        entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+        if entry.is_dir():
+            subdirectories.append(entry_relative)
+        elif entry.name.endswith(".md") and entry.is_file():
+            stat = entry.stat()
+            record = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+            vault_manifest["files"][entry_relative] = record
+    return subdirectories
+
+
+def forget_manifest_directory(vault_manifest, relative, recursive=False):
+    # drop the directory's files (and optionally subdirectories) from manifest.
+    prefix = f"{relative}/" if relative else ""
+    for file_relative in list(vault_manifest["files"]):
+        if not file_relative.startswith(prefix):
+            continue
+        if recursive or "/" not in file_relative[len(prefix) :]:
+            del vault_manifest["files"][file_relative]
+    if recursive:
+        for directory in list(vault_manifest["directories"]):
+            if directory == relative or directory.startswith(prefix):
+                del vault_manifest["directories"][directory]
+
+
+def get_manifest_subdirectories(vault_manifest, relative):
+    subdirectories = set()
+    for directory in vault_manifest["directories"]:
+        if directory and directory.rpartition("/")[0] == relative:
+            subdirectories.add(directory)
+    return subdirectories
+
+
+def build_manifest(root_path):
+    # walk the whole vault once, recording every directory and markdown file.
+    root_path = get_path(root_path)
+    vault_manifest = {"directories": {}, "files": {}}
+    pending = [""]
+    while pending:
+        relative = pending.pop()
+        subdirectories = scan_manifest_directory(root_path, relative, vault_manifest)
+        pending.extend(subdirectories or [])
+    write_updated_json(get_manifest_path(root_path), vault_manifest)
+    return vault_manifest
+
+
+def load_manifest(root_path):
+    manifest_path = get_manifest_path(root_path)
+    if not manifest_path.is_file():
+        return None
+    try:
+        vault_manifest = get_updated_json(manifest_path)
+    except json.JSONDecodeError:
+        return None
+    if "directories" not in vault_manifest or "files" not in vault_manifest:
+        return None
+    return vault_manifest
+
+
+def refresh_manifest(root_path, stat_files=True):
+    # only directories whose mtime changed are re-scanned, since adding,
+    # removing or renaming an entry always bumps its parent directory's mtime.
+    # editing a note in place doesn't, so with stat_files the notes in
+    # unchanged directories are re-stat'ed to keep their records current.
+    root_path = get_path(root_path)
+    vault_manifest = load_manifest(root_path)
+    if vault_manifest is None:
+        return build_manifest(root_path)
+    changed, scanned = False, set()
+    pending = sorted(vault_manifest["directories"])
+    while pending:
+        relative = pending.pop()
+        if relative not in vault_manifest["directories"]:
+            continue  # already forgotten along with a removed parent
+        directory = root_path / relative if relative else root_path
+        try:
+            directory_mtime = directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            directory_mtime = None
+        if directory_mtime == vault_manifest["directories"][relative]:
+            continue
+        changed = True
+        if directory_mtime is None:
+            forget_manifest_directory(vault_manifest, relative, recursive=True)
+            continue
+        known = get_manifest_subdirectories(vault_manifest, relative)
+        forget_manifest_directory(vault_manifest, relative)
+        current = scan_manifest_directory(root_path, relative, vault_manifest)
+        if current is None:
+            forget_manifest_directory(vault_manifest, relative, recursive=True)
+            continue
+        scanned.add(relative)
+        for subdirectory in known - set(current):
+            forget_manifest_directory(vault_manifest, subdirectory, recursive=True)
+        for subdirectory in set(current) - known:
+            # a new directory has no recorded mtime, so it is scanned fully
+            vault_manifest["directories"][subdirectory] = None
+            pending.append(subdirectory)
+    if stat_files:
+        changed |= restat_manifest_files(root_path, vault_manifest, scanned)
+    if changed:
+        write_updated_json(get_manifest_path(root_path), vault_manifest)
+    return vault_manifest
+
+
+def restat_manifest_files(root_path, vault_manifest, scanned):
+    # refresh the records of notes in directories that weren't just scanned.
+    changed = False
+    root = str(root_path)
+    for relative, record in list(vault_manifest["files"].items()):
+        if relative.rpartition("/")[0] in scanned:
+            continue
+        try:
+            stat = os.stat(os.path.join(root, relative))
+        except FileNotFoundError:
+            del vault_manifest["files"][relative]
+            changed = True
+            continue
+        current = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        if current != record:
+            vault_manifest["files"][relative] = current
+            changed = True
+    return changed
+
+
+def get_changed_files(root_path, records, stat_files=True):
+    # compare the manifest's [size, mtime] for each note against records, a
+    # relative path -> [size, mtime] mapping kept by some index or cache.
+    # returns the current records and the relative paths that differ from
+    # (or are missing in) records; notes gone from the vault are simply absent.
+    vault_manifest = refresh_manifest(root_path, stat_files=stat_files)
+    current, changed = {}, []
+    for relative, record in sorted(vault_manifest["files"].items()):
+        current[relative] = record[:2]
+        if records.get(relative) != record[:2]:
+            changed.append(relative)
+    return current, changed
+
+
 def sanitize_person_links(person_link):
     translation = str.maketrans({'"': "", "[": "", "]": "", ".": "", "/": ""})
     if isinstance(person_link, list):
@@ -113,20 +353,21 @@ def add_content(supplied_content, addition, index=-1):
 
 def file_add_lines(file_path, lines_list, index=-1):
     read_lines = read_file_lines(file_path)
+    original = list(read_lines)
     read_lines = add_lines(read_lines, lines_list, index=index)
-    return write_file_lines(file_path, read_lines)
+    return write_file_lines(file_path, read_lines, original=original)
 
 
 def file_strip_whitespace(file_path):
-    contents = read_file_contents(file_path)
-    contents = strip_contents(contents)
-    return write_file_contents(file_path, contents)
+    original = read_file_contents(file_path)
+    contents = strip_contents(original)
+    return write_file_contents(file_path, contents, original=original)
 
 
 def file_add_content(file_path, addition, index=-1):
-    contents = read_file_contents(file_path)
-    contents = add_content(contents, addition, index=index)
-    return write_file_contents(file_path, contents)
+    original = read_file_contents(file_path)
+    contents = add_content(original, addition, index=index)
+    return write_file_contents(file_path, contents, original=original)
 
 
 def remove_list_indeces(supplied_list, index_list):
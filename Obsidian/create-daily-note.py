@@ -18,12 +18,17 @@ import logging
 import subprocess
 import time
 import re
+import importlib
+
+dnu = importlib.import_module("daily-note-utils")
 
 # all static global variables that will not change or are calculated at runtime with args
 BASE_DAILYS_PATH = "C:\\Users\\jason\\Personal-Notes\\Dailys\\"
 TEMPLATE_DAILYS_PATH = "C:\\Users\\jason\\Personal-Notes\\Extras\\Templates\\daily-note.md"
 LOGGING_FILE = "C:\\Users\\jason\\Development\\Logs\\Obsidian\\create-daily-note.log"
 DETERMINER = "transpired"
+STEP_TIMEOUT = 30
+POLL_INTERVAL = 0.25
 
     # all date specific variables that are calculated at runtime
 today = datetime.date.today()
@@ -32,7 +37,7 @@ DAILY_PATH = os.path.join(DAILYS_PATH, today.isoformat() + ".md")
 DAILY_NAME = os.path.split(DAILY_PATH)[-1]
 
 # caller supplied all three required paths for note creation so use args
-if len(sys.argv) == 4:
+if len(sys.argv) == 4 and sys.argv[1] != "backfill":
     DAILYS_PATH = sys.argv[1]
     TEMPLATE_DAILYS_PATH = sys.argv[2]
     LOGGING_FILE = sys.argv[3]
@@ -49,9 +54,16 @@ def main():
     openDaily = "obsidian://daily?vault=Personal-Notes"
     fillTemplates = "obsidian://adv-uri?vault=Personal-Notes^&commandid=templater-obsidian%3Areplace-in-file-templater"
 
-    commandOrder = [fillTemplates, openDaily, openVault]
-    while commandOrder:
-        currentCommand = commandOrder.pop()
+    # each command waits on an observable condition instead of a fixed sleep: the
+    # vault needs none since opening the daily note waits for the note itself.
+    commandOrder = [
+        (openVault, None, False),
+        (openDaily, dailyNoteExists, True),
+        (fillTemplates, dailyNoteModified, False),
+    ]
+    for currentCommand, readiness, required in commandOrder:
+        condition = readiness(DAILY_PATH) if readiness is not None else None
+        stepStart = time.monotonic()
         result = None
         try: # attempt to use Window's specific startfile method
             result = subprocess.run(["start", currentCommand], shell=True, capture_output=True, text=True)
@@ -63,11 +75,48 @@ def main():
             errorMessage = f"Obsidian URI command {currentCommand} failed with output: {result.stderr}"
             logger.error(f"{errorMessage}, aborting.")
             return
-        time.sleep(10)
+        ready = waitForCondition(condition) if condition is not None else True
+        elapsed = time.monotonic() - stepStart
+        if not ready and required:
+            logger.error(f"Obsidian URI command {currentCommand} not ready after {elapsed:.2f}s, aborting.")
+            return
+        if not ready:
+            logger.warning(f"Obsidian URI command {currentCommand} not ready after {elapsed:.2f}s, continuing.")
+        else: # log where the time goes for each step of the run
+            logger.info(f"Obsidian URI command {currentCommand} ready after {elapsed:.2f}s.")
         
     goodMessage = f"Successfully ran Obsidian URI commands to instantiate {DAILY_NAME}."
     logger.info(goodMessage)
 
+def waitForCondition(condition, timeout=STEP_TIMEOUT, interval=POLL_INTERVAL):
+    """Poll condition until it holds or timeout seconds pass, returning whether it held."""
+
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+def getModifiedTime(notePath):
+    """Return the note's modification time, or None when it doesn't exist yet."""
+
+    try: # the note may not have been created by Obsidian yet
+        return os.stat(notePath).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def dailyNoteExists(dailyPath):
+    """Build a condition that holds once the daily note exists."""
+
+    return lambda: os.path.exists(dailyPath)
+
+def dailyNoteModified(dailyPath):
+    """Build a condition that holds once the daily note changes from its current state."""
+
+    initialModified = getModifiedTime(dailyPath)
+    return lambda: getModifiedTime(dailyPath) not in (None, initialModified)
+
 def oldMain():
     """Perform all steps required to create today's daily note."""
 
@@ -89,6 +138,78 @@ def oldMain():
     # log a final success message to the logging file
     logger.info(f"Creation of daily note {DAILY_NAME} completed.")
 
+def backfill(startDate, endDate, dailysPath=BASE_DAILYS_PATH, templatePath=TEMPLATE_DAILYS_PATH):
+    """Create every missing daily note from startDate to endDate, parsing the template once."""
+
+    startDate, endDate = dnu.extractDateObject(startDate), dnu.extractDateObject(endDate)
+    missingDailys = findMissingDailys(startDate, endDate, dailysPath)
+    if not missingDailys:
+        logger.info(f"No daily notes missing from {startDate} to {endDate}.")
+        return []
+
+    templateParts = loadDailyTemplate(templatePath)
+    createdDailys = []
+    for missingDate, dailyPath in missingDailys:
+        os.makedirs(os.path.dirname(dailyPath), exist_ok=True)
+        try: # exclusive creation so a note made in the meantime is never overwritten
+            with open(dailyPath, "x") as dailyFile:
+                dailyFile.write(renderDailyNote(templateParts, missingDate))
+        except FileExistsError:
+            logger.warning(f"Daily note {dailyPath} appeared during backfill, skipping.")
+            continue
+        createdDailys.append(dailyPath)
+    logger.info(f"Backfilled {len(createdDailys)} daily notes from {startDate} to {endDate}.")
+    return createdDailys
+
+def findMissingDailys(startDate, endDate, dailysPath):
+    """List (date, path) for each day without a note, listing each month folder only once."""
+
+    missingDailys, monthListings = [], {}
+    currentDate = startDate
+    while currentDate <= endDate:
+        monthPath = os.path.join(dailysPath, f"{currentDate.year}/{currentDate.strftime('%B')}/")
+        if monthPath not in monthListings:
+            monthListings[monthPath] = set(os.listdir(monthPath)) if os.path.isdir(monthPath) else set()
+        dailyName = currentDate.isoformat() + ".md"
+        if dailyName not in monthListings[monthPath]:
+            missingDailys.append((currentDate, os.path.join(monthPath, dailyName)))
+        currentDate += datetime.timedelta(days=1)
+    return missingDailys
+
+def loadDailyTemplate(templatePath):
+    """Read and sanitize the template once, splitting it into text, date and header parts."""
+
+    with open(templatePath, "r") as templateFile:
+        templateLines = templateFile.readlines()
+
+    templateParts = []
+    for index, templateLine in enumerate(templateLines):
+        if DETERMINER in templateLine: # the same trim sanitizeDailyNote makes
+            templateLine = templateLine[:-2] + "\n"
+        if index == dnu.HEADER_INDEX:
+            templateParts.append(("header", None))
+            continue
+        lineStart = 0
+        for match in dnu.DATE_NAVIGATION_PATTERN.finditer(templateLine):
+            templateParts.append(("text", templateLine[lineStart:match.start()]))
+            templateParts.append(("date", dnu.NAVIGATION_OFFSETS[match.group(1)]))
+            lineStart = match.end()
+        templateParts.append(("text", templateLine[lineStart:]))
+    return templateParts
+
+def renderDailyNote(templateParts, noteDate):
+    """Render a pre-parsed template for noteDate entirely in memory."""
+
+    renderedParts = []
+    for kind, value in templateParts:
+        if kind == "date":
+            renderedParts.append((noteDate + datetime.timedelta(days=value)).isoformat())
+        elif kind == "header":
+            renderedParts.append(noteDate.strftime(dnu.HEADER_FORMAT))
+        else: # plain template text that never changes between days
+            renderedParts.append(value)
+    return "".join(renderedParts)
+
 def checkPathsExist(pathList):
     """Check to make sure all supplied paths in pathList exist."""
 
@@ -175,4 +296,7 @@ def sanitizeDailyNote(notePath, determiner, noteName):
     logger.info(f"Successfully sanitized daily note {noteName}.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) == 4 and sys.argv[1] == "backfill":
+        backfill(sys.argv[2], sys.argv[3])
+    else: # the scheduled run that creates today's daily note
+        main()
\ No newline at end of file
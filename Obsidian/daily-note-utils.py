@@ -14,9 +14,15 @@
 import datetime
 import pathlib
 import re
+import common
 
 ISO_FORMAT_REGEX = r"[\d]{4}[-][\d]{2}[-][\d]{2}"
 HEADER_INDEX = 8
+HEADER_FORMAT = "# %A, %B %#d, %Y\n"
+
+# an ISO date, capturing any |yesterday or |tomorrow navigation alias after it
+DATE_NAVIGATION_PATTERN = re.compile(f"{ISO_FORMAT_REGEX}(?=(\\|yesterday|\\|tomorrow)|)")
+NAVIGATION_OFFSETS = {None: 0, "|yesterday": -1, "|tomorrow": 1}
 
 
 def extractDateObject(dateObject):
@@ -152,59 +158,7 @@ def processNoteString(noteString, recursively):
     return noteList
 
 
-def regexMatchesString(regexString, matchString):
-    """Compile the supplied regex string and return a list of matches from a string.
-
-    Args:
-        regexString (str): the regex matcher to compile and find matches with.
-        matchString (str): the actual string to find matches in using regex.
-
-    Returns:
-        list: the list of found matches within the string from regex matches. 
-            Since python re.finditer() returns an interable and not a list, 
-            the function returns a list for typical list properties and functions.
-    """
-
-    matcher = re.compile(regexString)
-    matches = matcher.finditer(matchString)
-    foundMatches = [match for match in matches]
-    return foundMatches
-
-
-def replaceLineMatches(lineString, index, newDate, updateHeader):
-    """Given a string line, replace its ISO format dates with newDate and other updates.
-
-    Args:
-        lineString (str): just a string to replace found matches with newDate.
-        index (int): the index from a line in a note file used for checks and header updates.
-        newDate (pathlib.Path): the date to replace matches with in the lineString.
-        updateHeader (bool): update the daily note header with a strftime date.
-
-    Returns:
-        str: the updated lineString with replaced newDate ISO date matches.
-    """
-
-    if index == HEADER_INDEX and updateHeader:
-        return newDate.strftime("# %A, %B %#d, %Y\n")
-
-    updatedString = lineString
-    for match in regexMatchesString(ISO_FORMAT_REGEX, lineString):
-        inputDate = newDate.isoformat()
-        dayNavigation = ""
-        try: # attempt to get any additional information about day links
-            dayNavigation = lineString[match.end():match.end() + 10]
-        except IndexError as ie:
-            pass
-
-        conversion = {"|yesterday": 1, "|tomorrow'": -1}
-        if any(key in dayNavigation for key in conversion.keys()):
-            correctDate = newDate - datetime.timedelta(days=conversion[dayNavigation])
-            inputDate = correctDate.isoformat()
-        updatedString = updatedString.replace(match.group(), inputDate, 1)
-    return updatedString
-
-
-def updateDailyDates(noteObject, newDate=None, updateHeader=True, recursively=False):
+def updateDailyDates(noteObject, newDate=None, updateHeader=True, recursively=False, dryRun=False, workers=None):
     """Given a directory, list of notes, or single note, update the ISO dates in note body.
 
     Args:
@@ -214,31 +168,91 @@ def updateDailyDates(noteObject, newDate=None, updateHeader=True, recursively=Fa
         updateHeader (bool, optional): flag to update the daily note header with the 
             supplied newDate in a strftime output. Defaults to True.
         recursively (bool, optional): update notes in found subdirectories. Defaults to False.
+        dryRun (bool, optional): only report what each note would change. Defaults to False.
+        workers (int, optional): process the notes across this many worker processes. 
+            Defaults to None, processing the notes one after another.
+
+    Returns:
+        list: (notePath, result) tuples with each note's updateDatesHandler result, 
+            where a note that could not be updated gives its exception instead.
     """
 
     noteList = getNotesList(noteObject, recursively)
-    for notePath in noteList:
-        useDate = pathlib.Path(notePath).stem if newDate is None else newDate
-        updateDatesHandler(notePath, useDate, updateHeader=updateHeader)
+    return common.run_on_files(noteList, updateDatesHandler, newDate, updateHeader, dryRun, workers=workers)
+
 
+def rewriteDailyContent(noteContent, newDate, updateHeader):
+    """Rewrite every ISO date in a whole note in a single pass with one compiled pattern.
+        Dates followed by a |yesterday or |tomorrow navigation alias become the day 
+        before or after newDate, and all other dates become newDate itself.
 
-def updateDatesHandler(notePath, newDate, updateHeader):
+    Args:
+        noteContent (str): the entire contents of the daily note.
+        newDate (datetime.date): the date to replace matches with.
+        updateHeader (bool): replace the daily note header line with the newDate.
+
+    Returns:
+        tuple: the rewritten contents and the number of dates (and header) changed.
+    """
+
+    changes = 0
+    def replaceDate(match):
+        nonlocal changes
+        offset = NAVIGATION_OFFSETS[match.group(1)]
+        replacement = (newDate + datetime.timedelta(days=offset)).isoformat()
+        changes += replacement != match.group()
+        return replacement
+
+    headerStart, headerEnd = 0, 0
+    if updateHeader: # find the header line's span without splitting the note into lines
+        for _ in range(HEADER_INDEX):
+            headerStart = noteContent.find("\n", headerStart) + 1
+            if headerStart == 0:
+                break
+        if headerStart:
+            headerEnd = noteContent.find("\n", headerStart) + 1 or len(noteContent)
+
+    if headerEnd <= headerStart: # there is no header line to replace in this note
+        return DATE_NAVIGATION_PATTERN.sub(replaceDate, noteContent), changes
+
+    header = newDate.strftime(HEADER_FORMAT)
+    changes += header != noteContent[headerStart:headerEnd]
+    before = DATE_NAVIGATION_PATTERN.sub(replaceDate, noteContent[:headerStart])
+    after = DATE_NAVIGATION_PATTERN.sub(replaceDate, noteContent[headerEnd:])
+    return before + header + after, changes
+
+
+def updateDatesHandler(notePath, newDate=None, updateHeader=True, dryRun=False):
     """Given a daily note, update its ISO date matches to match the supplied newDate.
-        This function will open the file, read its lines and overwrite with all 
-        processed new lines.
+        This function will open the file, rewrite its whole contents at once and 
+        overwrite it, skipping the write entirely when nothing would change 
+        so the note's modification time (and Obsidian Sync) is left alone.
 
     Args:
         notePath (str): the note path string to open and write to.
-        newDate (any): the new date to replace matches with.
-        updateHeader (bool): update the daily note header with the newDate.
+        newDate (any, optional): the new date to replace matches with. Defaults to None, 
+            using the date the note is named after (YYYY-MM-DD.md).
+        updateHeader (bool, optional): update the daily note header with the newDate. 
+            Defaults to True.
+        dryRun (bool, optional): count the changes without writing. Defaults to False.
+
+    Returns:
+        bool: whether the note was rewritten, or when dryRun is set,
+        int: the number of dates (and header) that would be changed.
     """
+    if newDate is None:
+        newDate = pathlib.Path(notePath).stem
     newDate = extractDateObject(newDate)
     
     with open(notePath, "r+") as notePathFile:
-        noteLines = notePathFile.readlines()
-        for index in range(len(noteLines)):
-            noteLines[index] = replaceLineMatches(noteLines[index], index, newDate, updateHeader)
-        # put the index at beginning, clear the file, and write the new lines
+        noteContent = notePathFile.read()
+        updatedContent, changes = rewriteDailyContent(noteContent, newDate, updateHeader)
+        if dryRun:
+            return changes
+        if updatedContent == noteContent:
+            return False
+        # put the index at beginning, clear the file, and write the new content
         notePathFile.seek(0)
         notePathFile.truncate(0)
-        notePathFile.writelines(noteLines)
\ No newline at end of file
+        notePathFile.write(updatedContent)
+    return True
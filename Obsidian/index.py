@@ -0,0 +1,258 @@
+"""index.py: Persistent full-text index of the notes in a vault"""
+
+import re
+import zlib
+import common
+
+INDEX_NAME = ".vault-index"
+TOKEN_REGEX = r"\w+"
+SHARD_COUNT = 64
+# loaded indexes by vault root, kept in memory so repeated queries don't
+# reload the index from disk.
+INDEX_CACHE = {}
+
+
+def tokenize(contents):
+    return re.findall(TOKEN_REGEX, contents.lower())
+
+
+def get_index_path(root_path):
+    return common.get_path(root_path) / INDEX_NAME
+
+
+def get_shard(token):
+    return zlib.crc32(token.encode("utf-8")) % SHARD_COUNT
+
+
+def read_index_part(root_path, name, default):
+    part_path = get_index_path(root_path) / f"{name}.json"
+    if not part_path.is_file():
+        return default
+    try:
+        return common.get_updated_json(part_path)
+    except ValueError:
+        return default
+
+
+def load_index(root_path):
+    # the index is a directory of parts: files maps each note to the
+    # [size, mtime] it was indexed at, vocabulary lists every token, tokens
+    # maps each note to its distinct tokens (read only when notes change) and
+    # the postings are split into shards by token, each mapping a token to
+    # the notes and space separated word positions it appears at. queries
+    # only ever load the shards of the tokens they look up.
+    root_path = common.get_path(root_path)
+    files = read_index_part(root_path, "files", {})
+    vocabulary = read_index_part(root_path, "vocabulary", [])
+    if not isinstance(files, dict) or not isinstance(vocabulary, list):
+        files, vocabulary = {}, []
+    return {
+        "root": root_path,
+        "files": files,
+        "vocabulary": set(vocabulary),
+        "tokens": None,
+        "shards": {},
+        "dirty": set(),
+        "trigrams": None,
+        "unreadable": set(),
+    }
+
+
+def get_index(root_path, threads=8):
+    # the cached index brought up to date; every note is still re-stat'ed, as
+    # notes edited in place don't change their directory's mtime.
+    return refresh_index(root_path, threads=threads)
+
+
+def get_shard_postings(vault_index, shard):
+    if shard not in vault_index["shards"]:
+        postings = read_index_part(vault_index["root"], f"shard-{shard:02d}", {})
+        vault_index["shards"][shard] = postings
+    return vault_index["shards"][shard]
+
+
+def get_postings(vault_index, token):
+    if token not in vault_index["vocabulary"]:
+        return {}
+    return get_shard_postings(vault_index, get_shard(token)).get(token, {})
+
+
+def get_file_tokens(vault_index):
+    if vault_index["tokens"] is None:
+        vault_index["tokens"] = read_index_part(vault_index["root"], "tokens", {})
+    return vault_index["tokens"]
+
+
+def remove_file_postings(vault_index, relative):
+    for token in get_file_tokens(vault_index).pop(relative, []):
+        shard = get_shard(token)
+        shard_postings = get_shard_postings(vault_index, shard)
+        postings = shard_postings.get(token, {})
+        postings.pop(relative, None)
+        if not postings:
+            shard_postings.pop(token, None)
+            vault_index["vocabulary"].discard(token)
+            vault_index["trigrams"] = None
+        vault_index["dirty"].add(shard)
+    vault_index["files"].pop(relative, None)
+
+
+def add_file_postings(vault_index, relative, contents, stat_record):
+    positions = {}
+    for position, token in enumerate(tokenize(contents)):
+        positions.setdefault(token, []).append(str(position))
+    for token, token_positions in positions.items():
+        shard = get_shard(token)
+        shard_postings = get_shard_postings(vault_index, shard)
+        shard_postings.setdefault(token, {})[relative] = " ".join(token_positions)
+        if token not in vault_index["vocabulary"]:
+            vault_index["vocabulary"].add(token)
+            vault_index["trigrams"] = None
+        vault_index["dirty"].add(shard)
+    get_file_tokens(vault_index)[relative] = list(positions)
+    vault_index["files"][relative] = stat_record
+
+
+def write_index(vault_index):
+    index_path = get_index_path(vault_index["root"])
+    index_path.mkdir(exist_ok=True)
+    for shard in sorted(vault_index["dirty"]):
+        shard_path = index_path / f"shard-{shard:02d}.json"
+        common.write_updated_json(shard_path, vault_index["shards"][shard])
+    vault_index["dirty"].clear()
+    common.write_updated_json(index_path / "files.json", vault_index["files"])
+    vocabulary = sorted(vault_index["vocabulary"])
+    common.write_updated_json(index_path / "vocabulary.json", vocabulary)
+    common.write_updated_json(index_path / "tokens.json", get_file_tokens(vault_index))
+
+
+def refresh_index(root_path, threads=8, stat_files=True):
+    # notes are re-tokenized only when their size or mtime changed since they
+    # were last indexed (read ahead on a thread pool), and notes that
+    # disappeared are dropped. unreadable lists the notes that couldn't be
+    # read, whose postings may be out of date. without stat_files only notes
+    # in directories that changed are checked.
+    root_path = common.get_path(root_path)
+    vault_index = INDEX_CACHE.get(root_path)
+    if vault_index is None:
+        vault_index = INDEX_CACHE[root_path] = load_index(root_path)
+    current, stale = common.get_changed_files(
+        root_path, vault_index["files"], stat_files=stat_files
+    )
+    changed = False
+    vault_index["unreadable"] = set()
+    stale_paths = [root_path / relative for relative in stale]
+    for file_path, contents in common.read_files_ahead(stale_paths, threads=threads):
+        relative = file_path.relative_to(root_path).as_posix()
+        if isinstance(contents, Exception):
+            # left out of this refresh's answers and retried on the next one
+            vault_index["unreadable"].add(relative)
+            continue
+        remove_file_postings(vault_index, relative)
+        add_file_postings(vault_index, relative, contents, current[relative])
+        changed = True
+    for relative in set(vault_index["files"]) - set(current):
+        remove_file_postings(vault_index, relative)
+        changed = True
+    if changed:
+        write_index(vault_index)
+    return vault_index
+
+
+def find_word(vault_index, word):
+    return set(get_postings(vault_index, word.lower()))
+
+
+def find_words(vault_index, words):
+    # notes containing every one of the words, anywhere in the note.
+    found = None
+    for word in words:
+        word_files = find_word(vault_index, word)
+        found = word_files if found is None else found & word_files
+        if not found:
+            break
+    return found or set()
+
+
+def find_phrase(vault_index, phrase):
+    # notes containing the phrase's tokens at consecutive word positions.
+    tokens = tokenize(phrase)
+    if not tokens:
+        return set()
+    found = set()
+    for relative in find_words(vault_index, tokens):
+        first_positions = get_postings(vault_index, tokens[0])[relative]
+        starts = set(map(int, first_positions.split()))
+        for offset, token in enumerate(tokens[1:], start=1):
+            positions = get_postings(vault_index, token)[relative].split()
+            starts &= {int(position) - offset for position in positions}
+            if not starts:
+                break
+        if starts:
+            found.add(relative)
+    return found
+
+
+def get_trigrams(vault_index):
+    # every three character run of each token, mapped to the tokens with it.
+    if vault_index["trigrams"] is None:
+        trigrams = {}
+        for token in vault_index["vocabulary"]:
+            for start in range(len(token) - 2):
+                trigrams.setdefault(token[start : start + 3], set()).add(token)
+        vault_index["trigrams"] = trigrams
+    return vault_index["trigrams"]
+
+
+def find_matching_tokens(vault_index, piece, open_start, open_end):
+    # tokens a word-run of a literal can fall within. a run bounded by other
+    # characters on both sides is a whole token, one open at an end of the
+    # literal may continue a longer token there. None when a short open run
+    # can't be looked up and so can't narrow anything.
+    if not open_start and not open_end:
+        return {piece} if piece in vault_index["vocabulary"] else set()
+    if len(piece) < 3:
+        return None
+    tokens = None
+    trigrams = get_trigrams(vault_index)
+    for start in range(len(piece) - 2):
+        trigram_tokens = trigrams.get(piece[start : start + 3], set())
+        tokens = trigram_tokens if tokens is None else tokens & trigram_tokens
+        if not tokens:
+            return set()
+    if not open_start:
+        return {token for token in tokens if token.startswith(piece)}
+    if not open_end:
+        return {token for token in tokens if token.endswith(piece)}
+    return {token for token in tokens if piece in token}
+
+
+def find_substring_candidates(vault_index, literal):
+    # every word-run inside a literal must fall within some token of a note
+    # that contains the literal, so this is a (case-insensitive) superset of
+    # the notes containing it. None means the index cannot narrow anything.
+    lowered = literal.lower()
+    found = None
+    for match in re.finditer(TOKEN_REGEX, lowered):
+        open_start, open_end = match.start() == 0, match.end() == len(lowered)
+        tokens = find_matching_tokens(vault_index, match.group(), open_start, open_end)
+        if tokens is None:
+            continue
+        piece_files = set()
+        for token in tokens:
+            piece_files.update(get_postings(vault_index, token))
+        found = piece_files if found is None else found & piece_files
+        if not found:
+            break
+    return found
+
+
+def search_index(root_path, query, phrase=False):
+    # answer word (all words present) or phrase queries without reading notes.
+    root_path = common.get_path(root_path)
+    vault_index = get_index(root_path)
+    if phrase:
+        found = find_phrase(vault_index, query)
+    else:
+        found = find_words(vault_index, tokenize(query))
+    return [root_path / relative for relative in sorted(found)]
@@ -0,0 +1,242 @@
+"""links.py: Incremental graph of the wikilinks between notes in a vault"""
+
+import os
+import re
+import common
+import importlib
+
+properties = importlib.import_module("properties")
+
+GRAPH_NAME = ".vault-links.json"
+# bumped whenever notes are scanned differently.
+GRAPH_VERSION = 2
+# groups: embed marker, target, heading or block reference, display alias
+WIKILINK_REGEX = r"(!?)\[\[([^\[\]|#^]*)([#^][^\[\]|]*)?(?:\|([^\[\]]*))?\]\]"
+
+
+def extract_links(contents):
+    # distinct link targets in the note, covering [[Name]], [[Name|alias]],
+    # [[Name#heading]], ![[embeds]] and quoted links in the properties.
+    targets = []
+    for match in re.finditer(WIKILINK_REGEX, contents):
+        target = match.group(2).strip()
+        if target and target not in targets:
+            targets.append(target)
+    return targets
+
+
+def get_link_name(target):
+    # links may carry a folder path or the .md suffix, notes are matched by name.
+    name = target.replace("\\", "/").rpartition("/")[2]
+    if name.lower().endswith(".md"):
+        name = name[: -len(".md")]
+    return name.strip().lower()
+
+
+def get_link_path(target):
+    # a folder-qualified link's path, lowercased and without the .md suffix.
+    path = target.replace("\\", "/").strip().strip("/")
+    if path.lower().endswith(".md"):
+        path = path[: -len(".md")]
+    return path.lower()
+
+
+def get_graph_path(root_path):
+    return common.get_path(root_path) / GRAPH_NAME
+
+
+def load_graph(root_path):
+    # files maps each note to the [size, mtime] it was scanned at, links to its
+    # outgoing link targets and aliases to its frontmatter aliases.
+    graph_path = get_graph_path(root_path)
+    empty_graph = {"version": GRAPH_VERSION, "files": {}, "links": {}, "aliases": {}}
+    if not graph_path.is_file():
+        return empty_graph
+    try:
+        graph = common.get_updated_json(graph_path)
+    except ValueError:
+        return empty_graph
+    if graph.get("version") != GRAPH_VERSION:
+        return empty_graph
+    if any(key not in graph for key in empty_graph):
+        return empty_graph
+    return graph
+
+
+def forget_note(graph, relative):
+    for key in ["files", "links", "aliases"]:
+        graph[key].pop(relative, None)
+
+
+def scan_note(graph, relative, contents, stat_record):
+    frontmatter = properties.parse_frontmatter(contents.splitlines(keepends=True))
+    aliases = properties.split_list_value(frontmatter.get("aliases") or [])
+    graph["links"][relative] = extract_links(contents)
+    graph["aliases"][relative] = [a.strip().strip("\"'") for a in aliases]
+    graph["files"][relative] = stat_record
+
+
+def refresh_graph(root_path, threads=8):
+    # only notes whose size or mtime changed since the last scan are read,
+    # ahead of time on a thread pool.
+    root_path = common.get_path(root_path)
+    graph = load_graph(root_path)
+    current, stale = common.get_changed_files(root_path, graph["files"])
+    changed = False
+    stale_paths = [root_path / relative for relative in stale]
+    for file_path, contents in common.read_files_ahead(stale_paths, threads=threads):
+        if isinstance(contents, Exception):
+            continue  # unreadable, so it is retried on the next refresh
+        relative = file_path.relative_to(root_path).as_posix()
+        scan_note(graph, relative, contents, current[relative])
+        changed = True
+    for relative in set(graph["files"]) - set(current):
+        forget_note(graph, relative)
+        changed = True
+    if changed:
+        common.write_updated_json(get_graph_path(root_path), graph)
+    return graph
+
+
+def get_note_names(graph):
+    # lowercased note names and aliases to notes; names win over aliases.
+    # notes in folders are also keyed by their path, for folder-qualified links.
+    note_names, alias_names = {}, {}
+    for relative in sorted(graph["files"]):
+        note_names.setdefault(get_link_name(relative), relative)
+        if "/" in relative:
+            note_names[get_link_path(relative)] = relative
+        for alias in graph["aliases"].get(relative, []):
+            alias_names.setdefault(alias.lower(), relative)
+    for alias, relative in alias_names.items():
+        note_names.setdefault(alias, relative)
+    return note_names
+
+
+def resolve_link(note_names, target):
+    # a link with a folder only resolves to a note at that path (or one ending
+    # in it, like [[Sub/Name]] for A/Sub/Name.md), never to another same-named
+    # note elsewhere.
+    if "/" not in target.replace("\\", "/").strip("/"):
+        return note_names.get(get_link_name(target))
+    path = get_link_path(target)
+    if path in note_names:
+        return note_names[path]
+    for key, relative in note_names.items():
+        if key.endswith(f"/{path}"):
+            return relative
+    return None
+
+
+def get_backlink_map(graph):
+    # each note mapped to the set of other notes linking to it.
+    note_names = get_note_names(graph)
+    backlink_map = {relative: set() for relative in graph["files"]}
+    for source, targets in graph["links"].items():
+        for target in targets:
+            relative = resolve_link(note_names, target)
+            if relative is not None and relative != source:
+                backlink_map[relative].add(source)
+    return backlink_map
+
+
+def get_backlinks(root_path, note_path):
+    root_path = common.get_path(root_path)
+    graph = refresh_graph(root_path)
+    relative = common.get_path(note_path)
+    if relative.is_absolute():
+        relative = relative.relative_to(root_path)
+    backlinks = get_backlink_map(graph).get(relative.as_posix(), set())
+    return [root_path / source for source in sorted(backlinks)]
+
+
+def rank_notes(backlink_map, iterations=20, damping=0.85):
+    # PageRank over the link graph, where notes without outgoing links share
+    # their rank evenly across every note.
+    notes = list(backlink_map)
+    if not notes:
+        return {}
+    outgoing = {relative: 0 for relative in notes}
+    for sources in backlink_map.values():
+        for source in sources:
+            outgoing[source] += 1
+    rank = {relative: 1 / len(notes) for relative in notes}
+    for _ in range(iterations):
+        dangling = sum(rank[r] for r in notes if not outgoing[r]) / len(notes)
+        rank = {
+            relative: (1 - damping) / len(notes)
+            + damping
+            * (dangling + sum(rank[s] / outgoing[s] for s in backlink_map[relative]))
+            for relative in notes
+        }
+    return rank
+
+
+def get_popular_notes(graph, count=10, rank=False):
+    # (note, score) pairs by in-degree, or PageRank with rank, highest first.
+    backlink_map = get_backlink_map(graph)
+    if rank:
+        scores = rank_notes(backlink_map)
+    else:
+        scores = {relative: len(sources) for relative, sources in backlink_map.items()}
+    popular = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return popular[:count] if count else popular
+
+
+def rename_links_in_content(
+    contents, old_name, new_name, note_names=None, relative=None
+):
+    # point every link to old_name (with or without a folder, heading, alias
+    # or embed marker) at new_name instead; alias links are left alone. given
+    # the vault's note_names and the renamed note's relative path, only links
+    # that resolve to that note are rewritten, so a link to another note with
+    # the same name (in another folder) is kept.
+    old_link_name = get_link_name(old_name)
+
+    def handle_link(match):
+        target = match.group(2)
+        if get_link_name(target) != old_link_name:
+            return match.group()
+        if note_names is not None and resolve_link(note_names, target) != relative:
+            return match.group()
+        folder, separator, _ = target.replace("\\", "/").rpartition("/")
+        embed, heading, alias = match.group(1), match.group(3), match.group(4)
+        renamed = f"{embed}[[{folder}{separator}{new_name}{heading or ''}"
+        return renamed + (f"|{alias}]]" if alias is not None else "]]")
+
+    return re.sub(WIKILINK_REGEX, handle_link, contents)
+
+
+def rename_note(root_path, note_path, new_name):
+    # rename a note and rewrite the links to it, reading only the notes the
+    # link graph says link to it. returns the new path and, for each linking
+    # note, whether it was rewritten.
+    root_path = common.get_path(root_path)
+    note_path = common.get_path(note_path)
+    if not note_path.is_absolute():
+        note_path = root_path / note_path
+    new_path = note_path.with_name(f"{new_name}.md")
+    if new_path.exists():
+        raise FileExistsError(f"Cannot rename onto an existing note: {new_path}")
+    graph = refresh_graph(root_path)
+    relative = note_path.relative_to(root_path).as_posix()
+    linking = get_backlink_map(graph).get(relative, set()) | {relative}
+    note_names = get_note_names(graph)
+    results = []
+    for source in sorted(linking):
+        source_path = root_path / source
+        original = common.read_file_contents(source_path)
+        contents = rename_links_in_content(
+            original, note_path.stem, new_name, note_names, relative
+        )
+        result = common.write_file_contents(source_path, contents, original=original)
+        stat = os.stat(source_path)
+        scan_note(graph, source, contents, [stat.st_size, stat.st_mtime_ns])
+        if source != relative:
+            results.append((source_path, result))
+    os.rename(note_path, new_path)
+    new_relative = new_path.relative_to(root_path).as_posix()
+    for key in ["files", "links", "aliases"]:
+        graph[key][new_relative] = graph[key].pop(relative)
+    common.write_updated_json(get_graph_path(root_path), graph)
+    return new_path, results
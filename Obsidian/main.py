@@ -1,4 +1,5 @@
 import importlib
+import argparse
 import datetime
 import platform
 
@@ -16,7 +17,18 @@ else:  # use WSL's path to user notes on windows WSL
 
 
 def main():
-    pass
+    parser = argparse.ArgumentParser(description="Obsidian vault scripting.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stale = subparsers.add_parser("stale", help="people overdue for contact")
+    stale.add_argument("--days", type=int, help="not contacted in this many days")
+    stale.add_argument("--top", type=int, help="only the most overdue people")
+
+    arguments = parser.parse_args()
+    if arguments.command == "stale":
+        stale_contacts = upc.get_stale_contacts(days=arguments.days, top=arguments.top)
+        for person, contacted in stale_contacts:
+            print(f"{contacted or 'never'}\t{person}")
 
 
 if __name__ == "__main__":
@@ -1,19 +1,138 @@
 # High-level obsidian note manipulation and modification
 
+import os
+import re
+import heapq
+import bisect
 import datetime
 import platform
 import subprocess
+import importlib
+import collections
+
+common = importlib.import_module("common")
+properties = importlib.import_module("properties")
+dnu = importlib.import_module("daily-note-utils")
+links = importlib.import_module("links")
 
 if platform.system() == "Darwin":
     BASE_PATH = "/Users/jasonboyd/Tracking/"
 else:  # use WSL's path to user notes on windows WSL
     BASE_PATH = "/mnt/c/Users/basonjoyd/Tracking/"
 
-TEMPLATES_PATH = ""
+TEMPLATES_PATH = BASE_PATH + "Extras/Templates/"
+
+# {name}, {name[key]} or {name:format} placeholders, where the format can't
+# start with a space. anything else in braces, like {title: 'x'} objects or
+# ${name} interpolation in dataviewjs code, is left as template text.
+PLACEHOLDER_REGEX = (
+    r"(?<!\$)\{([A-Za-z_]\w*)((?:\[[^\[\]{}]+\])*)(?::(?!\s)([^{}]*))?\}"
+)
+# compiled templates by path, kept until the template file's mtime changes.
+TEMPLATE_CACHE = {}
+
+STATISTICS_NAME = ".vault-statistics.json"
+# bumped whenever per-note statistics are gathered differently.
+STATISTICS_VERSION = 2
+LARGEST_NOTES = 10
+TAG_REGEX = r"(?<![\w#&])#([^\W\d][\w/-]*)"
+LINK_REGEX = r"!?\[\[[^\[\]]+\]\]"
+DATAVIEW_DELIMETER = "```dataview"
+
+# sorted (iso date, relative path) pairs for every YYYY-MM-DD.md note, rebuilt
+# only when the vault manifest reports a directory change.
+DAILY_INDEX = {"root": None, "directories": None, "notes": []}
+
+
+def create_templated_note(
+    template_name, note_path, date=None, props=None, templates_path=None, **fields
+):
+    # render a template from the vault into a new note. placeholders can use
+    # the date (any extractDateObject form), yesterday, tomorrow, now, title,
+    # props[key] and any extra fields, where callables are computed per note
+    # from the other values.
+    templates_path = common.get_path(templates_path or TEMPLATES_PATH)
+    template_path = templates_path / template_name
+    if template_path.suffix != ".md":
+        template_path = template_path.with_name(f"{template_path.name}.md")
+    note_path = common.get_path(note_path)
+    date = dnu.extractDateObject(date)
+    context = {
+        "date": date,
+        "yesterday": date - datetime.timedelta(days=1),
+        "tomorrow": date + datetime.timedelta(days=1),
+        "now": datetime.datetime.now(),
+        "title": note_path.stem,
+        "props": props or {},
+        **fields,
+    }
+    contents = render_template(load_template(template_path), context)
+    note_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(note_path, "x") as fp:
+        fp.write(contents)
+    return note_path
+
+
+def load_template(template_path):
+    # a template is parsed once and then reused until its file changes.
+    template_path = common.get_path(template_path)
+    mtime = os.stat(template_path).st_mtime_ns
+    cached = TEMPLATE_CACHE.get(template_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    compiled = compile_template(common.read_file_contents(template_path))
+    TEMPLATE_CACHE[template_path] = (mtime, compiled)
+    return compiled
+
+
+def compile_template(template_text):
+    # split the template into literal text and (name, keys, format, original)
+    # fields so rendering is only lookups and joins.
+    compiled, position = [], 0
+    for match in re.finditer(PLACEHOLDER_REGEX, template_text):
+        compiled.append(template_text[position : match.start()])
+        keys = tuple(
+            key.strip().strip("\"'")
+            for key in re.findall(r"\[([^\]]+)\]", match.group(2))
+        )
+        compiled.append((match.group(1), keys, match.group(3), match.group()))
+        position = match.end()
+    compiled.append(template_text[position:])
+    return compiled
+
+
+def render_template(compiled, context):
+    rendered = []
+    for part in compiled:
+        if isinstance(part, str):
+            rendered.append(part)
+        else:
+            rendered.append(render_template_field(part, context))
+    return "".join(rendered)
 
 
-def create_templated_note(template_name):
-    pass
+def render_template_field(field, context):
+    # unknown names or keys, or a format the value can't take, leave the
+    # placeholder exactly as it was written.
+    name, keys, format_spec, original = field
+    if name not in context:
+        return original
+    value = context[name]
+    if callable(value):
+        value = value(context)
+    for key in keys:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return original
+    if format_spec is not None:
+        try:
+            return format(value, format_spec)
+        except (ValueError, TypeError):
+            return original
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    return str(value)
 
 
 def open_daily_note():
@@ -23,13 +142,139 @@ def open_daily_note():
     return result
 
 
-def gather_interval_files(start, end):
-    pass
+def gather_interval_files(start, end, root_path=BASE_PATH):
+    # dated notes from start to end inclusive; both take the same forms as
+    # extractDateObject (ISO string, timestamp, date or None for today).
+    root_path = common.get_path(root_path)
+    start, end = get_day_string(start), get_day_string(end)
+    daily_notes = get_daily_index(root_path)
+    first = bisect.bisect_left(daily_notes, (start,))
+    last = bisect.bisect_right(daily_notes, (end, chr(0x10FFFF)))
+    return [root_path / relative for _, relative in daily_notes[first:last]]
+
+
+def get_day_string(date_object):
+    # datetimes are cut to their day, so one compares equal to its note's name.
+    day = dnu.extractDateObject(date_object)
+    return datetime.date(day.year, day.month, day.day).isoformat()
+
+
+def get_daily_index(root_path):
+    # only note names matter here, so the notes themselves aren't re-stat'ed.
+    vault_manifest = common.refresh_manifest(root_path, stat_files=False)
+    directories = vault_manifest["directories"]
+    if DAILY_INDEX["root"] == root_path and DAILY_INDEX["directories"] == directories:
+        return DAILY_INDEX["notes"]
+    daily_notes = []
+    for relative in vault_manifest["files"]:
+        stem = relative.rpartition("/")[2][: -len(".md")]
+        if not re.fullmatch(dnu.ISO_FORMAT_REGEX, stem):
+            continue
+        try:
+            datetime.date.fromisoformat(stem)
+        except ValueError:
+            continue
+        daily_notes.append((stem, relative))
+    daily_notes.sort()
+    DAILY_INDEX.update(root=root_path, directories=directories, notes=daily_notes)
+    return daily_notes
+
+
+def gather_popular_files(root_path, count=10, rank=False):
+    # the most linked-to notes as (path, score), from the persisted link graph.
+    root_path = common.get_path(root_path)
+    graph = links.refresh_graph(root_path)
+    popular = links.get_popular_notes(graph, count=count, rank=rank)
+    return [(root_path / relative, score) for relative, score in popular]
+
+
+def build_vault_statistics(root_path, workers=None):
+    # vault-wide totals built from per-note statistics. notes are scanned
+    # (across a process pool with workers) only when their size or mtime
+    # changed since the cached statistics were taken.
+    root_path = common.get_path(root_path)
+    cache_path = root_path / STATISTICS_NAME
+    cached = {}
+    if cache_path.is_file():
+        try:  # a corrupt or half-written cache is rebuilt like a missing one
+            cache = common.get_updated_json(cache_path)
+        except ValueError:
+            cache = {}
+        if cache.get("version") == STATISTICS_VERSION:
+            cached = cache.get("files", {})
+    cached_records = {relative: record["stat"] for relative, record in cached.items()}
+    stat_records, stale = common.get_changed_files(root_path, cached_records)
+    current = {relative: cached.get(relative) for relative in stat_records}
+    for relative in stale:
+        current[relative] = {"stat": stat_records[relative], "statistics": None}
+    stale = [root_path / relative for relative in stale]
+    for file_path, statistics in common.run_on_files(
+        stale, gather_file_statistics, workers=workers
+    ):
+        relative = file_path.relative_to(root_path).as_posix()
+        if isinstance(statistics, Exception):
+            del current[relative]  # unreadable, so leave it out of the totals
+            continue
+        current[relative]["statistics"] = statistics
+    if current != cached:
+        cache = {"version": STATISTICS_VERSION, "files": current}
+        common.write_updated_json(cache_path, cache)
+    vault_statistics = empty_vault_statistics()
+    for relative, record in current.items():
+        merge_vault_statistics(vault_statistics, relative, record["statistics"])
+    return finish_vault_statistics(vault_statistics)
+
+
+def gather_file_statistics(file_path):
+    # everything is taken from a single read of the note.
+    contents = common.read_file_contents(file_path)
+    frontmatter = properties.parse_frontmatter(contents.splitlines(keepends=True))
+    tags = collections.Counter(re.findall(TAG_REGEX, contents))
+    frontmatter_tags = properties.split_list_value(frontmatter.get("tags") or [])
+    for tag in frontmatter_tags:
+        tags[tag.strip().lstrip("#")] += 1
+    return {
+        "bytes": len(contents.encode("utf-8")),
+        "words": len(contents.split()),
+        "lines": len(contents.splitlines()),
+        "keys": frontmatter.keys(),
+        "tags": dict(tags),
+        "links": len(re.findall(LINK_REGEX, contents)),
+        "dataview": contents.count(DATAVIEW_DELIMETER),
+    }
+
+
+def empty_vault_statistics():
+    return {
+        "notes": 0,
+        "bytes": 0,
+        "words": 0,
+        "lines": 0,
+        "keys": collections.Counter(),
+        "tags": collections.Counter(),
+        "links": 0,
+        "dataview": 0,
+        "largest": [],
+    }
 
 
-def gather_popular_files(root_path):
-    pass
+def merge_vault_statistics(vault_statistics, relative, statistics):
+    # every field merges associatively, so notes can be combined in any order.
+    vault_statistics["notes"] += 1
+    for total in ["bytes", "words", "lines", "links", "dataview"]:
+        vault_statistics[total] += statistics[total]
+    vault_statistics["keys"].update(statistics["keys"])
+    vault_statistics["tags"].update(statistics["tags"])
+    largest = vault_statistics["largest"]
+    heapq.heappush(largest, (statistics["bytes"], relative))
+    if len(largest) > LARGEST_NOTES:
+        heapq.heappop(largest)
+    return vault_statistics
 
 
-def build_vault_statistics(root_path):
-    pass
+def finish_vault_statistics(vault_statistics):
+    vault_statistics["keys"] = dict(vault_statistics["keys"].most_common())
+    vault_statistics["tags"] = dict(vault_statistics["tags"].most_common())
+    largest = sorted(vault_statistics["largest"], reverse=True)
+    vault_statistics["largest"] = [(relative, size) for size, relative in largest]
+    return vault_statistics
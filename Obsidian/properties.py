@@ -1,4 +1,6 @@
 import common
+import contextlib
+import datetime
 import pathlib
 import importlib
 
@@ -12,71 +14,153 @@ PROPERTY_DELIMETER = "---\n"
 # 4. Write some of the more useful functions since those will be used in others.
 
 
+class Frontmatter:
+    # the property section of a note, gathered by parse_frontmatter in a single
+    # pass: ordered keys and values, each key's line span and the body offset.
+
+    def __init__(self, start=None, end=None):
+        self.start = start
+        self.end = end
+        self.properties = {}
+        self.spans = {}
+        self.body_position = None  # character offset, set by read_frontmatter
+
+    @property
+    def exists(self):
+        return self.start is not None and self.end is not None
+
+    @property
+    def body_offset(self):
+        # index of the first line after the properties section
+        return self.end + 1 if self.exists else 0
+
+    def keys(self):
+        return list(self.properties.keys())
+
+    def has(self, key):
+        return key in self.properties
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+    def get_typed(self, key, default=None):
+        if key not in self.properties:
+            return default
+        return convert_property_value(self.properties[key])
+
+    def typed(self):
+        return {key: convert_property_value(v) for key, v in self.properties.items()}
+
+
+def is_property_delimeter(line):
+    return line.rstrip() == PROPERTY_DELIMETER.rstrip()
+
+
+def parse_frontmatter(read_lines):
+    # the properties section must open the note (ignoring leading blank lines),
+    # so delimeters used as horizontal rules in the body are never mistaken.
+    frontmatter = Frontmatter()
+    key, key_values = None, []
+    for index, line in enumerate(read_lines):
+        if frontmatter.start is None:
+            if is_property_delimeter(line):
+                frontmatter.start = index
+            elif line.strip():
+                return frontmatter
+            continue
+        if is_property_delimeter(line):
+            frontmatter.end = index
+            break
+        line_parts = line.split(" ")
+        if ":" in line_parts[0]:
+            key, _, value = line.partition(":")
+            key = key.strip()
+            key_values = [value.strip()]
+            frontmatter.spans[key] = (index, index)
+        elif key is not None:
+            key_values.append(line.strip())
+            frontmatter.spans[key] = (frontmatter.spans[key][0], index)
+        else:
+            continue
+        frontmatter.properties[key] = assemble_property_value(key_values)
+    if frontmatter.end is None:
+        return Frontmatter()
+    return frontmatter
+
+
+def assemble_property_value(values):
+    if len(values) == 1:
+        return values[-1]
+    return clean_property_values(values)
+
+
+def convert_property_value(value):
+    # turn a raw property string (or list of them) into a python value.
+    if isinstance(value, list):
+        return [convert_property_value(v) for v in value]
+    # text that only looks like a number or date (2024-13-45, say) stays raw.
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    try:
+        if value.lstrip("-").isdigit():
+            return int(value)
+        if value.replace(".", "", 1).lstrip("-").isdigit():
+            return float(value)
+        if sap.is_in_contents(value, rf"^{sap.ISO_DATE_REGEX}$"):
+            return datetime.date.fromisoformat(value)
+    except ValueError:
+        pass
+    return value
+
+
+def split_list_value(value):
+    # a list property as python values, whether written as a yaml list, an
+    # inline [a, b] list or a comma separated string.
+    if isinstance(value, list):
+        return value
+    value = value.strip()
+    if value.startswith("[") and value.endswith("]") and not value.startswith("[["):
+        value = value[1:-1]
+    items = [item.strip().strip("\"'") for item in value.split(",")]
+    return [item for item in items if item]
+
+
+def read_frontmatter(file_path):
+    # only the properties section is read from disk, never the note body.
+    delimeter = PROPERTY_DELIMETER.rstrip()
+    read_lines, offset = common.read_frontmatter_lines(file_path, delimeter)
+    frontmatter = parse_frontmatter(read_lines)
+    frontmatter.body_position = offset
+    return frontmatter
+
+
 def has_property(read_lines):
-    count = 0
-    for line in read_lines:
-        count = count + 1 if line == PROPERTY_DELIMETER else count
-    return True if count == 2 else False
+    return parse_frontmatter(read_lines).exists
 
 
 def file_has_properties(file_path):
-    read_lines = common.read_file_lines(file_path)
-    return has_property(read_lines)
+    return read_frontmatter(file_path).exists
 
 
 def get_property_delimeter_indeces(read_lines):
-    if not has_property(read_lines):
-        return None, None
-    first, second = None, None
-    for index in range(len(read_lines)):
-        if read_lines[index] == PROPERTY_DELIMETER:
-            first = index if first is None else first
-            second = index if first is not None else second
-    return first, second
+    frontmatter = parse_frontmatter(read_lines)
+    return frontmatter.start, frontmatter.end
 
 
 def has_property_key(read_lines, key, return_index=False):
-    if not has_property(read_lines):
+    frontmatter = parse_frontmatter(read_lines)
+    if not frontmatter.has(key):
         return False
-    key = f"{key}:"
-    first, second = get_property_delimeter_indeces(read_lines)
-    for index in range(len(read_lines)):
-        if key in read_lines[index] and index in range(first, second):
-            return index if return_index else True
-    return False
+    return frontmatter.spans[key][0] if return_index else True
 
 
 def get_property_indeces(read_lines, key):
-    if not has_property_key(read_lines, key):
-        return None, None
-    key = f"{key}:"
-    property_start, property_end = get_property_delimeter_indeces(read_lines)
-    start, end = None, None
-    for index in range(property_start, property_end):
-        current_line = read_lines[index]
-        if start is not None:
-            line_parts = current_line.split(" ")
-            if ":" in line_parts[0]:
-                return start, end
-            end = index
-        if key in current_line:
-            start, end = index, index
-    return start, end
+    frontmatter = parse_frontmatter(read_lines)
+    return frontmatter.spans.get(key, (None, None))
 
 
 def get_property_value(read_lines, key):
-    if not has_property_key(read_lines, key):
-        return
-    values = []
-    start, end = get_property_indeces(read_lines, key)
-    for index in range(start, end + 1):
-        line_parts = read_lines[index].split(" ")
-        assembled_value = " ".join(line_parts[1:])
-        stripped_value = assembled_value.strip()
-        values.append(stripped_value)
-    if len(values) == 1:
-        return values[-1]
-    return clean_property_values(values)
+    return parse_frontmatter(read_lines).get(key)
 
 
 def clean_property_values(values):
@@ -90,21 +174,19 @@ def clean_property_values(values):
 
 def delete_property(file_path, key, write=True):
     read_lines = common.read_file_lines(file_path)
-    start, end = get_property_indeces(read_lines, key)
-    if start is None or end is None:
+    original = list(read_lines)
+    if not lines_delete_property(read_lines, key):
         return False
-    del read_lines[start : end + 1]
-    return read_lines if not write else common.write_file_lines(file_path, read_lines)
+    if not write:
+        return read_lines
+    return common.write_file_lines(file_path, read_lines, original=original)
 
 
 def add_property(file_path, key, value):
     read_lines = common.read_file_lines(file_path)
-    if has_property_key(read_lines, key):
-        return None
-    start, end = get_property_delimeter_indeces(read_lines)
-    if start is None or end is None:
-        return False
-    read_lines = handle_lines_insert_value(read_lines, end, key, value)
+    added = lines_add_property(read_lines, key, value)
+    if not added:
+        return added
     return common.write_file_lines(file_path, read_lines)
 
 
@@ -134,13 +216,97 @@ def handle_lines_insert_value(read_lines, index, key, value):
 
 def update_property(file_path, key, value):
     read_lines = common.read_file_lines(file_path)
-    index = has_property_key(read_lines, key, return_index=True)
-    if not index and isinstance(index, bool):
-        add_property(file_path, key, value)
-        return True
-    read_lines = delete_property(file_path, key, write=False)
-    read_lines = handle_lines_insert_value(read_lines, index, key, value)
-    return common.write_file_lines(file_path, read_lines)
+    original = list(read_lines)
+    updated = lines_update_property(read_lines, key, value)
+    if not updated:
+        return updated
+    return common.write_file_lines(file_path, read_lines, original=original)
+
+
+# In-memory property edits: each works on read_lines in place so any number of
+# them can be applied between a single read and a single write of the note.
+
+
+def lines_delete_property(read_lines, key):
+    start, end = get_property_indeces(read_lines, key)
+    if start is None or end is None:
+        return False
+    del read_lines[start : end + 1]
+    return True
+
+
+def lines_add_property(read_lines, key, value, create=False):
+    frontmatter = parse_frontmatter(read_lines)
+    if frontmatter.has(key):
+        return None
+    if not frontmatter.exists:
+        if not create:
+            return False
+        read_lines[0:0] = [PROPERTY_DELIMETER, PROPERTY_DELIMETER]
+        frontmatter = Frontmatter(0, 1)
+    handle_lines_insert_value(read_lines, frontmatter.end, key, value)
+    return True
+
+
+def lines_update_property(read_lines, key, value, create=False):
+    start, end = get_property_indeces(read_lines, key)
+    if start is None or end is None:
+        return lines_add_property(read_lines, key, value, create=create)
+    del read_lines[start : end + 1]
+    handle_lines_insert_value(read_lines, start, key, value)
+    return True
+
+
+def lines_rename_property(read_lines, key, replacement):
+    frontmatter = parse_frontmatter(read_lines)
+    if not frontmatter.has(key) or frontmatter.has(replacement):
+        return False
+    index = frontmatter.spans[key][0]
+    _, _, remainder = read_lines[index].partition(":")
+    read_lines[index] = f"{replacement}:{remainder}"
+    return True
+
+
+class PropertyEditor:
+    # handed out by edit_properties; every operation edits the note's lines in
+    # memory and the surrounding context writes them back once.
+
+    def __init__(self, file_path, read_lines):
+        self.file_path = file_path
+        self.lines = read_lines
+        self.original = list(read_lines)
+
+    @property
+    def changed(self):
+        return self.lines != self.original
+
+    @property
+    def frontmatter(self):
+        return parse_frontmatter(self.lines)
+
+    def get(self, key, default=None):
+        return self.frontmatter.get(key, default)
+
+    def add(self, key, value):
+        return lines_add_property(self.lines, key, value, create=True)
+
+    def update(self, key, value):
+        return lines_update_property(self.lines, key, value, create=True)
+
+    def delete(self, key):
+        return lines_delete_property(self.lines, key)
+
+    def rename(self, key, replacement):
+        return lines_rename_property(self.lines, key, replacement)
+
+
+@contextlib.contextmanager
+def edit_properties(file_path):
+    # with edit_properties(note) as editor: editor.update("contacted", date)
+    # reads the note on entry and writes it once on a clean exit, if changed.
+    editor = PropertyEditor(file_path, common.read_file_lines(file_path))
+    yield editor
+    common.write_file_lines(file_path, editor.lines, original=editor.original)
 
 
 def extract_property_key_line(read_line):
@@ -195,18 +361,7 @@ def print_property(file_path, key):
 
 def get_property_json(file_path, dictionary=True):
     # get the property and return it as a json/dict object.
-    read_lines = common.read_file_lines(file_path)
-    start, end = get_property_delimeter_indeces(read_lines)
-    property_lookup = {}
-    if start is None or end is None:
-        return property_lookup
-    for index in range(start + 1, end):
-        key = extract_property_key_line(read_lines[index])
-        if not key:
-            continue
-        value = get_property_value(read_lines, key)
-        property_lookup[key] = value
-    return property_lookup
+    return dict(read_frontmatter(file_path).properties)
 
 
 def write_property_json(file_path, properties, replace=True):
@@ -215,7 +370,7 @@ def write_property_json(file_path, properties, replace=True):
         if delete_properties(file_path):
             return common.file_add_lines(file_path, property_lines, index=0)
         return False
-    start, end = get_property_delimeter_indeces(read_lines)
+    end = read_frontmatter(file_path).end
     return common.file_add_lines(file_path, property_lines, index=end)
 
 
@@ -250,12 +405,9 @@ def delete_properties(file_path):
 
 def rename_property_key(file_path, key, replacement):
     read_lines = common.read_file_lines(file_path)
-    index = has_property_key(read_lines, key, return_index=True)
-    key, replacement = f"{key}:", f"{replacement}:"
-    if isinstance(index, int):
-        replaced = read_lines[index].replace(key, replacement)
-        read_lines[index] = replaced
-    return common.write_file_lines(file_path, read_lines)
+    original = list(read_lines)
+    lines_rename_property(read_lines, key, replacement)
+    return common.write_file_lines(file_path, read_lines, original=original)
 
 
 def get_property_keys(file_path):
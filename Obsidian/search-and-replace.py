@@ -1,18 +1,35 @@
+import os
+import mmap
 import pathlib
 import re
+import collections
+import functools
 import common
 import importlib
 
+try:  # the regex parser moved to a private module in python 3.11
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
 properties = importlib.import_module("properties")
+index = importlib.import_module("index")
 
 DATAVIEW_DELIMETER = "```dataview"
 DATAVIEW_QUERY_REGEX = r"`{3}dataview([^`{3}]|\n)*`{3}"
 ISO_DATE_REGEX = r"\d{4}-\d{2}-\d{2}"
 
+# line and column are 1-based; before and after hold any context lines.
+SearchMatch = collections.namedtuple(
+    "SearchMatch", ["path", "line", "column", "text", "before", "after"]
+)
+
 
 def is_in_contents(contents, pattern, regex=True):
     if not regex:
         return pattern in contents
+    if not could_match(contents, pattern):
+        return False
     return re.search(pattern, contents) is not None
 
 
@@ -20,12 +37,14 @@ def is_in_lines(lines, pattern, regex=True):
     for line in lines:
         if not regex and pattern in line:
             return True
-        if regex and is_in_content(line, pattern):
+        if regex and is_in_contents(line, pattern):
             return True
     return False
 
 
-def is_in_file(file_path, searchable, lines=False, regex=True):
+def is_in_file(file_path, searchable, lines=False, regex=True, mapped=False):
+    if mapped:
+        return find_in_mapped_file(file_path, searchable, regex=regex) is not None
     if not lines:
         contents = common.read_file_contents(file_path)
         return is_in_contents(contents, searchable, regex=regex)
@@ -33,13 +52,244 @@ def is_in_file(file_path, searchable, lines=False, regex=True):
     return is_in_lines(read_lines, searchable, regex=regex)
 
 
-def is_in_files(root_path, searchable, lines=False, regex=True):
+def find_in_mapped_file(file_path, searchable, regex=True):
+    # memory-map the note and search its raw utf-8 bytes, returning the first
+    # match decoded or None, so large notes are never decoded to answer a
+    # yes/no question. patterns that would match differently on bytes are
+    # searched on the decoded note instead.
+    if not is_bytes_safe(searchable, regex=regex):
+        contents = common.read_file_contents(file_path)
+        match = compile_search_pattern(searchable, regex=regex).search(contents)
+        return None if match is None else match.group()
+    matcher = compile_bytes_pattern(searchable, regex=regex)
+    with open(common.get_path(file_path), "rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            match = matcher.search(b"")
+            return None if match is None else ""
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            for literal in get_required_bytes_literals(searchable, regex=regex):
+                if mapped_file.find(literal) == -1:
+                    return None
+            match = matcher.search(mapped_file)
+            if match is None:
+                return None
+            return match.group().decode("utf-8", errors="replace")
+
+
+@functools.lru_cache(maxsize=256)
+def compile_bytes_pattern(pattern, regex=True):
+    if isinstance(pattern, re.Pattern):
+        flags = pattern.flags & ~re.UNICODE
+        return re.compile(pattern.pattern.encode("utf-8"), flags)
+    if not regex:
+        return re.compile(re.escape(pattern.encode("utf-8")))
+    return re.compile(pattern.encode("utf-8"))
+
+
+@functools.lru_cache(maxsize=256)
+def is_bytes_safe(pattern, regex=True):
+    # a utf-8 bytes search finds the same matches as the str pattern when it
+    # is a literal, or a regex of ascii characters and ascii classes only.
+    # ., negated classes, \d, \w, \s, \b and ignored case all act on single
+    # bytes (or ascii only) on bytes, so they differ on non-ascii text.
+    if not regex:
+        return True
+    flags = 0
+    if isinstance(pattern, re.Pattern):
+        pattern, flags = pattern.pattern, pattern.flags
+    if not pattern.isascii():
+        return False
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return False
+    state = getattr(parsed, "state", None) or getattr(parsed, "pattern", None)
+    if state.flags & re.IGNORECASE:
+        return False
+    return is_bytes_safe_parsed(parsed, bool(state.flags & re.ASCII))
+
+
+def is_bytes_safe_parsed(parsed, ascii_only):
+    # with the ASCII flag, \d, \w, \s and \b already only match ascii.
+    boundaries = [sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY]
+    for operation, argument in parsed:
+        if operation is sre_parse.LITERAL:
+            if argument > 0x7F:
+                return False
+        elif operation is sre_parse.IN:
+            for item_operation, item_argument in argument:
+                if item_operation is sre_parse.LITERAL and item_argument <= 0x7F:
+                    continue
+                if item_operation is sre_parse.RANGE and item_argument[1] <= 0x7F:
+                    continue
+                if item_operation is sre_parse.CATEGORY and ascii_only:
+                    continue
+                return False
+        elif operation is sre_parse.CATEGORY:
+            if not ascii_only:
+                return False
+        elif operation is sre_parse.AT:
+            if argument in boundaries and not ascii_only:
+                return False
+        elif operation is sre_parse.SUBPATTERN:
+            add_flags, subpattern = argument[1], argument[3]
+            if add_flags & re.IGNORECASE:
+                return False
+            if not is_bytes_safe_parsed(subpattern, ascii_only):
+                return False
+        elif operation in REPEAT_OPERATIONS:
+            if not is_bytes_safe_parsed(argument[2], ascii_only):
+                return False
+        elif operation is sre_parse.BRANCH:
+            for branch in argument[1]:
+                if not is_bytes_safe_parsed(branch, ascii_only):
+                    return False
+        elif operation in [sre_parse.ASSERT, sre_parse.ASSERT_NOT]:
+            if not is_bytes_safe_parsed(argument[1], ascii_only):
+                return False
+        elif operation is not sre_parse.GROUPREF:
+            return False  # ., negated classes and anything less common
+    return True
+
+
+def get_required_bytes_literals(pattern, regex=True):
+    if not regex:
+        return [pattern.encode("utf-8")]
+    return [literal.encode("utf-8") for literal in get_required_literals(pattern)]
+
+
+def is_in_files(
+    root_path,
+    searchable,
+    lines=False,
+    regex=True,
+    workers=None,
+    threads=None,
+    use_index=False,
+    mapped=False,
+):
+    # with use_index, only notes the full-text index can't rule out are read.
+    if use_index:
+        return is_in_indexed_files(
+            root_path,
+            searchable,
+            lines=lines,
+            regex=regex,
+            mapped=mapped,
+            workers=workers,
+            threads=threads,
+        )
     file_list = common.gather_files(root_path)
-    results = []
+    return common.run_on_files(
+        file_list,
+        is_in_file,
+        searchable,
+        lines=lines,
+        regex=regex,
+        mapped=mapped,
+        workers=workers,
+        threads=threads,
+    )
+
+
+def is_in_indexed_files(
+    root_path,
+    searchable,
+    lines=False,
+    regex=True,
+    mapped=False,
+    workers=None,
+    threads=None,
+):
+    # the same results, in the same order, as the plain is_in_files: notes the
+    # index rules out are False without being read, and notes the index has
+    # no current postings for (unreadable or not yet indexed) are read as
+    # usual, giving their error when they can't be.
+    root_path = common.get_path(root_path)
+    vault_index = index.get_index(root_path)
+    literals = get_required_literals(searchable) if regex else [searchable]
+    candidates = None
+    for literal in literals:
+        found = index.find_substring_candidates(vault_index, literal)
+        if found is not None:
+            candidates = found if candidates is None else candidates & found
+    file_list, read_list = common.gather_files(root_path), []
+    prefix = len(root_path.as_posix().rstrip("/")) + 1
     for file_path in file_list:
-        found = is_in_file(file_path, searchable, lines=lines, regex=regex)
-        results.append((file_path, found))
-    return results
+        relative = file_path.as_posix()[prefix:]
+        indexed = relative in vault_index["files"]
+        if relative in vault_index["unreadable"] or not indexed:
+            read_list.append(file_path)
+        elif candidates is None or relative in candidates:
+            read_list.append(file_path)
+    read_results = dict(
+        common.run_on_files(
+            read_list,
+            is_in_file,
+            searchable,
+            lines=lines,
+            regex=regex,
+            mapped=mapped,
+            workers=workers,
+            threads=threads,
+        )
+    )
+    return [(file_path, read_results.get(file_path, False)) for file_path in file_list]
+
+
+REPEAT_OPERATIONS = [sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT]
+if hasattr(sre_parse, "POSSESSIVE_REPEAT"):
+    REPEAT_OPERATIONS.append(sre_parse.POSSESSIVE_REPEAT)
+
+
+@functools.lru_cache(maxsize=256)
+def get_required_literals(pattern):
+    # the literal substrings that every match of the regex pattern contains.
+    flags = 0
+    if isinstance(pattern, re.Pattern):
+        pattern, flags = pattern.pattern, pattern.flags
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return ()
+    state = getattr(parsed, "state", None) or getattr(parsed, "pattern", None)
+    if state.flags & re.IGNORECASE:
+        return ()
+    literals = []
+    collect_required_literals(parsed, literals)
+    return tuple(literals)
+
+
+def collect_required_literals(parsed, literals):
+    # runs of plain characters are required, as are those inside groups and
+    # inside repeats of at least one; branches and classes end a run.
+    current = []
+    for operation, argument in parsed:
+        if operation is sre_parse.LITERAL:
+            current.append(chr(argument))
+            continue
+        if current:
+            literals.append("".join(current))
+        current = []
+        if operation is sre_parse.SUBPATTERN:
+            add_flags, subpattern = argument[1], argument[3]
+            if not add_flags & re.IGNORECASE:
+                collect_required_literals(subpattern, literals)
+        elif operation in REPEAT_OPERATIONS and argument[0] >= 1:
+            collect_required_literals(argument[2], literals)
+        elif operation is getattr(sre_parse, "ATOMIC_GROUP", None):
+            collect_required_literals(argument, literals)
+    if current:
+        literals.append("".join(current))
+
+
+def could_match(contents, pattern):
+    # a cheap substring check on the pattern's required literals, so notes
+    # that cannot possibly match never reach the regex engine.
+    for literal in get_required_literals(pattern):
+        if literal not in contents:
+            return False
+    return True
 
 
 def remove_in_content(contents, pattern, count=0, regex=True):
@@ -47,14 +297,29 @@ def remove_in_content(contents, pattern, count=0, regex=True):
         if count > 0:
             return contents.replace(pattern, "", count=count)
         return contents.replace(pattern, "")
+    if not could_match(contents, pattern):
+        return contents
     return re.sub(pattern, "", contents, count=count)
 
 
+def count_in_content(contents, pattern, count=0, regex=True):
+    # the number of matches a replace or remove with count would act on.
+    if not regex:
+        found = contents.count(pattern)
+    elif not could_match(contents, pattern):
+        found = 0
+    else:
+        found = sum(1 for _ in re.finditer(pattern, contents))
+    return min(found, count) if count > 0 else found
+
+
 def replace_in_content(contents, pattern, replacement, count=0, regex=True):
     if not regex:
         if count > 0:
             return contents.replace(pattern, replacement, count=count)
         return contents.replace(pattern, replacement)
+    if not could_match(contents, pattern):
+        return contents
     return re.sub(pattern, replacement, contents, count=count)
 
 
@@ -88,94 +353,186 @@ def get_matching_groups(pattern, contents):
     return [match.group() for match in results]
 
 
-def truncate_timed_iso_dates(file_path):
+def truncate_timed_iso_dates(file_path, dry_run=False):
     re_iso_time = r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}"
-    contents = common.read_file_contents(file_path)
+    original = common.read_file_contents(file_path)
+    if dry_run:
+        return count_in_content(original, re_iso_time)
 
     def handle_timed(match):
         timed_iso = match.group()
         corrected_iso = timed_iso.split(" ")[0]
         return corrected_iso
 
-    contents = replace_in_content(contents, re_iso_time, handle_timed)
-    return common.write_file_contents(file_path, contents)
+    contents = replace_in_content(original, re_iso_time, handle_timed)
+    return common.write_file_contents(file_path, contents, original=original)
 
 
 def replace_in_file(
-    file_path, pattern, replacement, count=0, regex=True, format_function=None
+    file_path,
+    pattern,
+    replacement,
+    count=0,
+    regex=True,
+    format_function=None,
+    dry_run=False,
 ):
-    # replace the pattern with replacement in a file.
+    # replace the pattern with replacement in a file, returning whether the
+    # file changed, or with dry_run, how many matches would be replaced.
+    original = common.read_file_contents(file_path)
+    if dry_run:
+        return count_in_content(original, pattern, count=count, regex=regex)
     if callable(format_function) and format_function is not None:
         replacement = format_function(file_path, replacement)
 
-    contents = common.read_file_contents(file_path)
     contents = replace_in_content(
-        contents, pattern, replacement, count=count, regex=regex
+        original, pattern, replacement, count=count, regex=regex
     )
-    return common.write_file_contents(file_path, contents)
+    return common.write_file_contents(file_path, contents, original=original)
 
 
 def replace_in_files(
-    root_path, pattern, replacement, count=0, regex=True, format_function=None
+    root_path,
+    pattern,
+    replacement,
+    count=0,
+    regex=True,
+    format_function=None,
+    workers=None,
+    threads=None,
+    dry_run=False,
 ):
     # replace the pattern with replacement across multiple files.
     file_list = common.gather_files(root_path)
-    results = []
-    for file_path in file_list:
-        result = replace_in_file(
-            file_path,
-            pattern,
-            replacement,
-            count=count,
-            regex=regex,
-            format_function=format_function,
-        )
-        results.append((file_path, result))
-    return results
+    return common.run_on_files(
+        file_list,
+        replace_in_file,
+        pattern,
+        replacement,
+        count=count,
+        regex=regex,
+        format_function=format_function,
+        dry_run=dry_run,
+        workers=workers,
+        threads=threads,
+    )
 
 
-def remove_in_file(file_path, pattern, count=0, regex=True):
+def compile_rules(rules, regex=True):
+    # precompile an ordered collection of (pattern, replacement) rules, where a
+    # rule may add its own regex flag as a third item. literal rules are escaped
+    # so every rule runs through the same compiled re.sub, and replacements may
+    # be strings or callables taking the match.
+    compiled_rules = []
+    for rule in rules:
+        pattern, replacement = rule[0], rule[1]
+        rule_regex = rule[2] if len(rule) > 2 else regex
+        if not isinstance(pattern, re.Pattern):
+            pattern = re.compile(pattern if rule_regex else re.escape(pattern))
+        if not rule_regex and isinstance(replacement, str):
+            replacement = replacement.replace("\\", "\\\\")
+        compiled_rules.append((pattern, replacement))
+    return compiled_rules
+
+
+def replace_rules_in_content(contents, compiled_rules, count=0):
+    # apply every rule in order to the contents, returning the new contents and
+    # the total number of replacements made.
+    total = 0
+    for pattern, replacement in compiled_rules:
+        if not could_match(contents, pattern):
+            continue
+        contents, replaced = pattern.subn(replacement, contents, count=count)
+        total += replaced
+    return contents, total
+
+
+def replace_rules_in_file(file_path, rules, count=0, regex=True, dry_run=False):
+    # one read and at most one write, however many rules are applied.
+    compiled_rules = compile_rules(rules, regex=regex)
+    original = common.read_file_contents(file_path)
+    contents, total = replace_rules_in_content(original, compiled_rules, count=count)
+    if dry_run:
+        return total
+    return common.write_file_contents(file_path, contents, original=original)
+
+
+def replace_rules_in_files(
+    root_path, rules, count=0, regex=True, workers=None, threads=None, dry_run=False
+):
+    # rules are compiled once up front; with workers, callable replacements
+    # must be module-level functions so they can be sent to the pool.
+    file_list = common.gather_files(root_path)
+    compiled_rules = compile_rules(rules, regex=regex)
+    return common.run_on_files(
+        file_list,
+        replace_rules_in_file,
+        compiled_rules,
+        count=count,
+        dry_run=dry_run,
+        workers=workers,
+        threads=threads,
+    )
+
+
+def remove_in_file(file_path, pattern, count=0, regex=True, dry_run=False):
     # remove the pattern with an empty string in a file.
-    contents = common.read_file_contents(file_path)
-    contents = remove_in_content(contents, pattern, count=count, regex=regex)
-    return common.write_file_contents(file_path, contents)
+    original = common.read_file_contents(file_path)
+    if dry_run:
+        return count_in_content(original, pattern, count=count, regex=regex)
+    contents = remove_in_content(original, pattern, count=count, regex=regex)
+    return common.write_file_contents(file_path, contents, original=original)
 
 
 def remove_in_file_lines(file_path, pattern, count=0, regex=True, remove=True):
-    read_lines = common.file_read_lines(file_path)
+    read_lines = common.read_file_lines(file_path)
+    original = list(read_lines)
     read_lines = remove_in_lines(
-        lines, pattern, count=count, regex=regex, remove=remove
+        read_lines, pattern, count=count, regex=regex, remove=remove
     )
-    return common.write_file_lines(file_path, read_lines)
+    return common.write_file_lines(file_path, read_lines, original=original)
 
 
-def remove_in_files(root_path, pattern, count=0, regex=True):
+def remove_in_files(
+    root_path, pattern, count=0, regex=True, workers=None, threads=None, dry_run=False
+):
     # remove the pattern with an emptry string across multiple files.
     file_list = common.gather_files(root_path)
-    results = []
-    for file_path in file_list:
-        result = remove_in_file(file_path, pattern, count=count, regex=regex)
-        results.append((file_path, result))
-    return results
+    return common.run_on_files(
+        file_list,
+        remove_in_file,
+        pattern,
+        count=count,
+        regex=regex,
+        dry_run=dry_run,
+        workers=workers,
+        threads=threads,
+    )
 
 
-def remove_in_files_lines(root_path, pattern, count=0, regex=True, remove=True):
+def remove_in_files_lines(
+    root_path, pattern, count=0, regex=True, remove=True, workers=None, threads=None
+):
     file_list = common.gather_files(root_path)
-    results = []
-    for file_path in file_list:
-        result = remove_in_file_lines(
-            file_path, pattern, count=count, regex=regex, remove=remove
-        )
-        results.append((file_path, result))
-    return results
+    return common.run_on_files(
+        file_list,
+        remove_in_file_lines,
+        pattern,
+        count=count,
+        regex=regex,
+        remove=remove,
+        workers=workers,
+        threads=threads,
+    )
 
 
 def file_remove_consecutive_duplicate_lines(file_path, removal="\n", limit=1):
     read_lines = common.read_file_lines(file_path)
+    original = list(read_lines)
     read_lines = remove_consecutive_duplicate_lines(
         read_lines, removal=removal, limit=limit
     )
-    return common.write_file_lines(file_path, read_lines)
+    return common.write_file_lines(file_path, read_lines, original=original)
 
 
 def remove_consecutive_duplicate_lines(read_lines, removal="\n", limit=1):
@@ -201,29 +558,84 @@ def delete_newlines_before_queries(read_lines, empty="\n"):
     return common.remove_list_indeces(read_lines, remove_indeces)
 
 
-def file_delete_newlines_before_queries(file_path, empty="\n"):
-    read_lines = common.read_file_lines(file_path)
-    read_lines = delete_newlines_before_queries(read_lines, empty=empty)
-    return common.write_file_lines(file_path, read_lines)
+def file_delete_newlines_before_queries(file_path, empty="\n", dry_run=False):
+    original = common.read_file_lines(file_path)
+    read_lines = delete_newlines_before_queries(original, empty=empty)
+    if dry_run:
+        return len(original) - len(read_lines)
+    return common.write_file_lines(file_path, read_lines, original=original)
 
 
-def files_delete_newlines_before_queries(root_path, empty="\n"):
+def files_delete_newlines_before_queries(
+    root_path, empty="\n", dry_run=False, workers=None, threads=None
+):
     file_list = common.gather_files(root_path)
-    results = []
-    for file_path in file_list:
-        result = file_delete_newlines_before_queries(file_path, empty=empty)
-        results.append((file_path, result))
-    return results
-
-
-def search_in_file(file_path, pattern, count=0, regex=True):
-    # return matches based on the pattern in the file.
-    pass
+    return common.run_on_files(
+        file_list,
+        file_delete_newlines_before_queries,
+        empty=empty,
+        dry_run=dry_run,
+        workers=workers,
+        threads=threads,
+    )
 
 
-def search_in_files(root_path, pattern, count=0, regex=True):
-    # return matches across files based on the pattern.
-    pass
+def compile_search_pattern(pattern, regex=True):
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    return re.compile(pattern if regex else re.escape(pattern))
+
+
+def search_in_file(file_path, pattern, count=0, regex=True, context=0):
+    # yield matches based on the pattern in the file as the lines are read.
+    # count caps the matches per file and context adds that many lines before
+    # and after each match. patterns are matched a line at a time.
+    file_path = common.get_path(file_path)
+    matcher = compile_search_pattern(pattern, regex=regex)
+    before = collections.deque(maxlen=context)
+    pending, found = [], 0
+    with open(file_path, "r") as fp:
+        for line_number, line in enumerate(fp, start=1):
+            line = line.rstrip("\n")
+            for record in pending:
+                record.after.append(line)
+            while pending and len(pending[0].after) >= context:
+                yield pending.pop(0)
+            if count > 0 and found >= count:
+                if not pending:
+                    return
+                continue
+            for match in matcher.finditer(line):
+                record = SearchMatch(
+                    file_path,
+                    line_number,
+                    match.start() + 1,
+                    match.group(),
+                    list(before),
+                    [],
+                )
+                found += 1
+                if context:
+                    pending.append(record)
+                else:
+                    yield record
+                if count > 0 and found >= count:
+                    break
+            before.append(line)
+    yield from pending
+
+
+def search_in_files(root_path, pattern, count=0, regex=True, limit=0, context=0):
+    # yield matches across files based on the pattern, stopping the walk as
+    # soon as limit matches have been found in total.
+    matcher = compile_search_pattern(pattern, regex=regex)
+    found = 0
+    for file_path in common.gather_files(root_path):
+        for record in search_in_file(file_path, matcher, count=count, context=context):
+            yield record
+            found += 1
+            if limit > 0 and found >= limit:
+                return
 
 
 # Useful and common format functions
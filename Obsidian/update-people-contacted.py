@@ -1,6 +1,9 @@
+import os
+import bisect
 import pathlib
 import common
 import datetime
+import hashlib
 import json
 import platform
 import importlib
@@ -15,34 +18,138 @@ else:  # use WSL's path to user notes on windows WSL
 MEETINGS_DIRECTORY = BASE_PATH + "Community/Meetings/"
 PEOPLE_DIRECTORY = BASE_PATH + "Community/People/"
 UPDATED_JSON = BASE_PATH + "Extras/Other/meetings.json"
+CONTACTED_JSON = BASE_PATH + "Extras/Other/contacted.json"
+
+# name -> person note lookup, built on first use and rebuilt only when a run
+# finds the People directory changed.
+PEOPLE_INDEX = {"signature": None, "names": {}}
 
 
 def update_contacted_automatic():
-    root_path = common.get_path(MEETINGS_DIRECTORY)
-    saved_meetings = common.get_updated_json(UPDATED_JSON)["meetings"]
-    current_meetings = get_oldest_sorted_meetings(MEETINGS_DIRECTORY)
-    update_meetings_list, total_results = [], []
-    for meeting in current_meetings:
+    # meetings.json keeps each processed meeting's stat, content hash and the
+    # attendees and date extracted from it, so unchanged meetings cost a stat
+    # and edited attendees or dates are re-applied (or undone) correctly.
+    saved_meetings, originals = load_meetings_state()
+    current_meetings, affected = {}, set()
+    for meeting in common.gather_files(MEETINGS_DIRECTORY):
         truncated_meeting = str(meeting).replace(MEETINGS_DIRECTORY, "")
-        if truncated_meeting not in saved_meetings:
-            update_meetings_list.append(meeting)
-    for meeting in update_meetings_list:
-        results = update_contacted_from_meeting(meeting)
-        total_results.append((meeting, results))
-    update_meetings = generate_updated_meetings_json()
+        previous = saved_meetings.get(truncated_meeting)
+        state = get_meeting_state(meeting, previous)
+        current_meetings[truncated_meeting] = state
+        if previous is None or not same_meeting_details(previous, state):
+            affected.update(state["attendees"])
+            affected.update(previous["attendees"] if previous else [])
+    for truncated_meeting in set(saved_meetings) - set(current_meetings):
+        affected.update(saved_meetings[truncated_meeting]["attendees"])
+    total_results = apply_contacted_changes(current_meetings, affected, originals)
+    updated_state = {"meetings": current_meetings, "originals": originals}
+    common.write_updated_json(UPDATED_JSON, updated_state)
     return total_results
 
 
 def generate_updated_meetings_json():
-    root_path = common.get_path(MEETINGS_DIRECTORY)
-    base_json = {"meetings": []}
-    meetings = get_oldest_sorted_meetings(MEETINGS_DIRECTORY)
-    meetings = [str(m).replace(MEETINGS_DIRECTORY, "") for m in meetings]
-    base_json["meetings"] = meetings
-    return common.write_updated_json(UPDATED_JSON, base_json)
+    current_meetings = {}
+    for meeting in common.gather_files(MEETINGS_DIRECTORY):
+        truncated_meeting = str(meeting).replace(MEETINGS_DIRECTORY, "")
+        current_meetings[truncated_meeting] = get_meeting_state(meeting)
+    _, originals = load_meetings_state()
+    updated_state = {"meetings": current_meetings, "originals": originals}
+    return common.write_updated_json(UPDATED_JSON, updated_state)
+
+
+def load_meetings_state():
+    # the saved meetings and the contacted originals. the older list-of-names
+    # format carries no details, so it (like a missing file) means every
+    # meeting is parsed once more.
+    if not common.get_path(UPDATED_JSON).is_file():
+        return {}, {}
+    updated_state = common.get_updated_json(UPDATED_JSON)
+    saved_meetings = updated_state.get("meetings")
+    if not isinstance(saved_meetings, dict):
+        saved_meetings = {}
+    return saved_meetings, updated_state.get("originals", {})
+
+
+def get_meeting_state(meeting_file, previous=None):
+    stat = os.stat(meeting_file)
+    stat_record = [stat.st_mtime_ns, stat.st_size]
+    if previous and [previous["mtime"], previous["size"]] == stat_record:
+        return previous
+    contents = common.read_file_contents(meeting_file)
+    content_hash = hashlib.sha256(contents.encode("utf-8")).hexdigest()
+    state = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": content_hash}
+    if previous and previous["hash"] == content_hash:
+        return {**previous, **state}
+    frontmatter = properties.parse_frontmatter(contents.splitlines(keepends=True))
+    attendee_links = frontmatter.get("attendees")
+    attendees = []
+    if attendee_links:
+        if not isinstance(attendee_links, list):
+            attendee_links = [attendee_links]
+        attendees = common.sanitize_person_links(attendee_links)
+    state["attendees"] = attendees
+    state["transpired"] = frontmatter.get("transpired") or None
+    return state
+
+
+def same_meeting_details(previous, state):
+    return (
+        previous["attendees"] == state["attendees"]
+        and previous["transpired"] == state["transpired"]
+    )
+
+
+def apply_contacted_changes(meetings_state, affected, originals):
+    # recompute contacted for the affected attendees from the saved details of
+    # every meeting, without reading any meeting note again. originals keeps
+    # each person's contacted from before the script first set it (and what
+    # it last wrote), so people left with no meetings get that value back
+    # unless it was changed by hand since; anyone else is left alone.
+    people_index = get_people_index(refresh=True)
+    associates = {people_index.get(name.strip().lower()) for name in affected}
+    associates.discard(None)
+    latest = {}
+    for state in meetings_state.values():
+        if not state["transpired"]:
+            continue
+        for name in state["attendees"]:
+            associate = people_index.get(name.strip().lower())
+            if associate not in associates:
+                continue
+            if associate not in latest or state["transpired"] > latest[associate]:
+                latest[associate] = state["transpired"]
+    results = []
+    for associate in sorted(associates):
+        truncated_person = str(associate).replace(PEOPLE_DIRECTORY, "")
+        contacted = properties.read_frontmatter(associate).get("contacted")
+        if associate in latest:
+            original = originals.setdefault(truncated_person, {"value": contacted})
+            original["written"] = latest[associate]
+            result = properties.update_property(
+                associate, "contacted", latest[associate]
+            )
+        else:
+            result = restore_contacted(
+                associate, contacted, originals.pop(truncated_person, None)
+            )
+        results.append((associate.name, result))
+    return results
+
+
+def restore_contacted(associate, contacted, original):
+    if original is None or contacted != original.get("written"):
+        return False
+    if original["value"] is None:
+        return properties.delete_property(associate, "contacted")
+    return properties.update_property(associate, "contacted", original["value"])
 
 
-def update_contacted_overall():
+def update_contacted_overall(aggregate=False):
+    # aggregate works out everyone's latest meeting first, then writes each
+    # person note at most once instead of once per meeting attended.
+    if aggregate:
+        return update_contacted_aggregated(common.gather_files(MEETINGS_DIRECTORY))
+    get_people_index(refresh=True)
     meetings = get_oldest_sorted_meetings(MEETINGS_DIRECTORY)
     total_results = []
     for meeting in meetings:
@@ -53,11 +160,7 @@ def update_contacted_overall():
 
 def get_oldest_sorted_meetings(root_path):
     meetings = common.gather_files(root_path)
-    meetings.sort(
-        key=lambda mt: properties.get_property_value(
-            common.read_file_lines(mt), "transpired"
-        )
-    )
+    meetings.sort(key=lambda mt: properties.read_frontmatter(mt).get("transpired"))
     return meetings
 
 
@@ -66,17 +169,41 @@ def update_contacted_from_meeting(meeting_file):
     if not meeting_file.exists():
         return False
     results = []
-    read_lines = common.read_file_lines(meeting_file)
-    transpired = properties.get_property_value(read_lines, "transpired")
+    transpired = properties.read_frontmatter(meeting_file).get("transpired")
     for associate in get_people_associated(meeting_file):
         result = properties.update_property(associate, "contacted", transpired)
         results.append((associate.name, result))
     return results
 
 
+def update_contacted_aggregated(meetings):
+    results = []
+    for associate, transpired in get_latest_contacted(meetings).items():
+        # update_property leaves the note untouched when contacted is current
+        result = properties.update_property(associate, "contacted", transpired)
+        results.append((associate.name, result))
+    return results
+
+
+def get_latest_contacted(meetings):
+    # each attendee's person note mapped to their latest transpired date.
+    get_people_index(refresh=True)
+    latest = {}
+    for meeting in meetings:
+        frontmatter = properties.read_frontmatter(meeting)
+        transpired = frontmatter.get("transpired")
+        attendee_links = frontmatter.get("attendees")
+        if not transpired or attendee_links is None:
+            continue
+        attendees = common.sanitize_person_links(attendee_links)
+        for associate in get_people_notes(attendees):
+            if associate not in latest or transpired > latest[associate]:
+                latest[associate] = transpired
+    return latest
+
+
 def get_people_associated(meeting_file):
-    read_lines = common.read_file_lines(meeting_file)
-    attendee_links = properties.get_property_value(read_lines, "attendees")
+    attendee_links = properties.read_frontmatter(meeting_file).get("attendees")
     if attendee_links is None:
         return []
     attendees = common.sanitize_person_links(attendee_links)
@@ -88,9 +215,90 @@ def get_people_notes(person_names):
     if not isinstance(person_names, list):
         person_names = [person_names]
     person_paths = []
-    person_names = [f"{pn}.md" for pn in person_names]
-    everyone = common.gather_files(PEOPLE_DIRECTORY)
-    for person in everyone:
-        if person.name in person_names:
+    people_index = get_people_index()
+    for person_name in person_names:
+        person = people_index.get(person_name.strip().lower())
+        if person is not None and person not in person_paths:
             person_paths.append(person)
     return person_paths
+
+
+def get_people_index(refresh=False):
+    # lookups reuse the index as is; each run passes refresh once up front so
+    # the People directory is checked once per run rather than per meeting.
+    # the signature is the directory mtimes the manifest keeps, which change
+    # whenever a person note is added, removed or renamed.
+    if PEOPLE_INDEX["signature"] is None or refresh:
+        vault_manifest = common.refresh_manifest(PEOPLE_DIRECTORY, stat_files=False)
+        signature = dict(vault_manifest["directories"])
+        if PEOPLE_INDEX["signature"] != signature:
+            PEOPLE_INDEX["names"] = build_people_index(PEOPLE_DIRECTORY)
+            PEOPLE_INDEX["signature"] = signature
+    return PEOPLE_INDEX["names"]
+
+
+def build_people_index(root_path):
+    # map lowercased note names (as written and as sanitized in attendee
+    # links) and frontmatter aliases to person notes; names win over aliases.
+    people_index, alias_index = {}, {}
+    for person in common.gather_files(root_path, manifest=True):
+        for name in [person.stem, common.sanitize_person_links(person.stem)]:
+            people_index.setdefault(name.strip().lower(), person)
+        aliases = properties.read_frontmatter(person).get("aliases") or []
+        for alias in properties.split_list_value(aliases):
+            alias_index.setdefault(alias.lower(), person)
+    for alias, person in alias_index.items():
+        people_index.setdefault(alias, person)
+    return people_index
+
+
+def get_stale_contacts(days=None, top=None, today=None):
+    # people not contacted in the last days (never contacted counts as most
+    # overdue), most overdue first and optionally only the top of them.
+    contacted_index = refresh_contacted_index()
+    if days is not None:
+        today = today or datetime.date.today()
+        cutoff = (today - datetime.timedelta(days=days)).isoformat()
+        contacted_index = contacted_index[
+            : bisect.bisect_left(contacted_index, (cutoff,))
+        ]
+    if top is not None:
+        contacted_index = contacted_index[:top]
+    return [
+        (pathlib.Path(person).stem, contacted) for contacted, person in contacted_index
+    ]
+
+
+def refresh_contacted_index():
+    # contacted.json keeps each person note's [size, mtime] and contacted
+    # date, so only notes the manifest reports changed since the last run have
+    # their properties read again. the result is a list of (contacted, person)
+    # sorted oldest contact first.
+    saved_people = {}
+    if common.get_path(CONTACTED_JSON).is_file():
+        try:
+            saved_people = common.get_updated_json(CONTACTED_JSON).get("people", {})
+        except ValueError:
+            saved_people = {}
+    saved_people = {
+        relative: record
+        for relative, record in saved_people.items()
+        if isinstance(record, dict)  # older [mtime, size, contacted] records
+    }
+    saved_records = {
+        relative: record["stat"] for relative, record in saved_people.items()
+    }
+    stat_records, stale = common.get_changed_files(PEOPLE_DIRECTORY, saved_records)
+    current_people = {relative: saved_people.get(relative) for relative in stat_records}
+    for relative in stale:
+        person = common.get_path(PEOPLE_DIRECTORY) / relative
+        contacted = properties.read_frontmatter(person).get("contacted") or ""
+        current_people[relative] = {
+            "stat": stat_records[relative],
+            "contacted": str(contacted),
+        }
+    if current_people != saved_people:
+        common.write_updated_json(CONTACTED_JSON, {"people": current_people})
+    return sorted(
+        (record["contacted"], relative) for relative, record in current_people.items()
+    )